@@ -5,7 +5,24 @@ import pandas as pd
 import altair as alt
 import plotly.express as px
 import plotly.graph_objects as go
+import plotly.io as pio
+import numpy as np
 import itertools
+import math
+import os
+import io
+import base64
+import hashlib
+import threading
+import functools
+import json
+import shutil
+import pyarrow as pa
+import time
+from collections import namedtuple
+from statistics import NormalDist
+from stockout import simulate_stockouts
+from compute import aggregate, polars_frame, HAVE_POLARS
 
 #######################
 # Page configuration
@@ -18,9 +35,140 @@ st.set_page_config(
 alt.themes.enable("dark")
 
 
+#######################
+# Locations
+# data/gazetteer.csv maps each city to its state (as named in the choropleth's
+# GeoJSON), region and coordinates. It is joined onto the dataset once per
+# data version, when the file is read, so renders never map locations.
+GAZETTEER_PATH = 'data/gazetteer.csv'
+GEO_COLUMNS = ['State', 'Region', 'Latitude', 'Longitude']
+
+# Gazetteer indexed by normalized city name, with categorical state and region
+@st.cache_data
+def load_gazetteer(path):
+    gazetteer = pd.read_csv(path, dtype={'State': 'category', 'Region': 'category'})
+    return gazetteer.set_index(gazetteer['City'].str.strip().str.casefold())[GEO_COLUMNS]
+
+
+# Look every distinct location up once and spread the result over the rows by category code
+def add_locations(df):
+    locations = df['Location'].astype('category')
+    lookup = load_gazetteer(GAZETTEER_PATH).reindex(locations.cat.categories.str.strip().str.casefold())
+    located = lookup.reset_index(drop=True).reindex(locations.cat.codes)
+    for column in GEO_COLUMNS:
+        df[column] = located[column].array
+    return df
+
+
 #######################
 # Load data
-df = pd.read_csv('data/supply_chain_data.csv')
+# The dataset lives in an immutable (version, frame) snapshot that also
+# carries the results derived from it. A background thread watches the data
+# file; once a rewrite has settled it reads the new file, builds the derived
+# results into the new snapshot and only then swaps it in. Each rerun reads
+# the snapshot once at the top, so a render that is already running finishes
+# on the version it started with, and a replaced version's results are freed
+# with it. SUPPLY_DASHBOARD_DATA_PATH points the app at another data file,
+# e.g. the load test's scratch copy.
+DATA_PATH = os.environ.get('SUPPLY_DASHBOARD_DATA_PATH', 'data/supply_chain_data.csv')
+RELOAD_POLL_SECONDS = 2
+
+Dataset = namedtuple('Dataset', ['version', 'df', 'digest', 'loaded_at', 'derived'])
+
+
+class DatasetStore:
+    def __init__(self, path):
+        self.path = path
+        self.builders = []  # functions of a Dataset to build before a swap
+        self.error = None
+        self._lock = threading.Lock()
+        self._build_lock = threading.RLock()  # results may use other results
+        self._loaded_signature = self._signature()
+        self._current = Dataset(1, *self._read(), time.time(), {})
+        self._columns = set(self._current.df.columns)
+        threading.Thread(target=self._watch, name='dataset-watcher', daemon=True).start()
+
+    def current(self):
+        with self._lock:
+            return self._current
+
+    # A derived result of a dataset, built once and kept in it, e.g. result(dataset, abc_analysis)
+    def result(self, dataset, build):
+        if build.__name__ not in dataset.derived:
+            with self._build_lock:
+                if build.__name__ not in dataset.derived:
+                    dataset.derived[build.__name__] = build(dataset)
+        return dataset.derived[build.__name__]
+
+    # The frame and a hash of the file's content
+    def _read(self):
+        with open(self.path, 'rb') as file:
+            content = file.read()
+        return add_locations(pd.read_csv(io.BytesIO(content))), hashlib.sha256(content).hexdigest()
+
+    def _signature(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    def _watch(self):
+        while True:
+            time.sleep(RELOAD_POLL_SECONDS)
+            signature = self._signature()
+            if signature is None or signature == self._loaded_signature:
+                continue
+
+            # A write is complete once size and mtime have not moved for a whole poll
+            time.sleep(RELOAD_POLL_SECONDS)
+            if self._signature() != signature:
+                continue
+            try:
+                df, digest = self._read()
+            except Exception as error:
+                self._reject(signature, f'could not read {self.path}: {error}')
+                continue
+            if self._signature() != signature:
+                continue  # rewritten while we were reading it
+            missing = self._columns - set(df.columns)
+            if missing:
+                self._reject(signature, f"{self.path} is missing columns {', '.join(sorted(missing))}")
+                continue
+
+            # Nobody else sees the new snapshot yet, so it is built without the build lock
+            version = self._current.version + 1
+            dataset = Dataset(version, df, digest, None, {})
+            try:
+                for build in list(self.builders):
+                    dataset.derived[build.__name__] = build(dataset)
+            except Exception as error:
+                self._reject(signature, f'could not prepare version {version}: {error}')
+                continue
+            with self._lock:
+                self._current = dataset._replace(loaded_at=time.time())
+                self._loaded_signature = signature
+                self.error = None
+
+    # Keep serving the current version and do not retry the same file
+    def _reject(self, signature, message):
+        with self._lock:
+            self._loaded_signature = signature
+            self.error = message
+
+
+@st.cache_resource
+def dataset_store(path):
+    return DatasetStore(path)
+
+
+dataset = dataset_store(DATA_PATH).current()
+data_version, df = dataset.version, dataset.df
+
+
+# A derived result of a data version, prebuilt by the store or built on first use
+def derived(dataset, build):
+    return dataset_store(DATA_PATH).result(dataset, build)
 
 
 #######################
@@ -30,27 +178,738 @@ with st.sidebar:
     st.write('\n\n')  # Adds two empty lines
     st.write('\n\n')  # Adds two empty lines
     visualization = st.sidebar.selectbox("Choose a Visualization", ["Main Dashboard","ABC Analysis", "Product Type Analytics", "Supplier Analytics", 
-                                                               "Shipping Analytics",])
+                                                               "Shipping Analytics", "Inventory Planning", "Cost & Margin",])
+    st.write('\n\n')  # Adds two empty lines
+    payload_budget_mode = st.toggle('Payload budget mode', value=True,
+                                    help='Trim chart data before it is sent to the browser and cap the bytes sent per page.')
+    fast_preview = st.toggle('Fast preview (sampled)', value=False,
+                             help='Draw the revenue curve, the scatter plot and the dataset viewer from a stratified '
+                                  'sample, with 95% confidence intervals. Switch off for exact results.')
+    st.caption(f"Data version {data_version} · loaded {time.strftime('%H:%M:%S', time.localtime(dataset.loaded_at))}")
+    if dataset_store(DATA_PATH).error:
+        st.warning(f"New data was not loaded: {dataset_store(DATA_PATH).error}")
+
+
+#######################
+# Payload budget
+# Numeric arrays are rounded to what the charts actually display, hover data
+# no trace shows is dropped and each page gets a byte ceiling. Charts that
+# would go over the ceiling lose their hover data first, then points, and are
+# only left out when that is still not enough.
+PAYLOAD_DECIMALS = 2
+PAGE_PAYLOAD_BUDGET = 2_000_000  # bytes of figure JSON per page
+PAYLOAD_MIN_POINTS = 500  # traces shorter than this are never decimated
+PAYLOAD_EXACT_KEYS = ('domain', 'range', 'sizeref')  # layout-like values that are never rounded
+
+payload_log = []
+
+
+#######################
+# Compute backend
+# Page aggregations run on pandas unless SUPPLY_DASHBOARD_BACKEND=polars is
+# set, in which case they run on Polars' lazy, multi-threaded engine (needs
+# `pip install polars`) and only the small results are converted to pandas
+# for plotting.
+COMPUTE_BACKEND = os.environ.get('SUPPLY_DASHBOARD_BACKEND', 'pandas').lower()
+
+if COMPUTE_BACKEND not in ('pandas', 'polars'):
+    st.sidebar.warning(f'Unknown compute backend "{COMPUTE_BACKEND}", using pandas.')
+    COMPUTE_BACKEND = 'pandas'
+if COMPUTE_BACKEND == 'polars' and not HAVE_POLARS:
+    st.sidebar.warning('Polars is not installed, using the pandas backend.')
+    COMPUTE_BACKEND = 'pandas'
+
+
+# The dataset as a Polars LazyFrame, converted once per data version
+def lazy_frame(dataset):
+    return polars_frame(dataset.df)
+
+
+# Page aggregations (compute.aggregate) run on this frame
+compute_df = derived(dataset, lazy_frame) if COMPUTE_BACKEND == 'polars' else df
+
+
+#######################
+# Disk cache
+# Derived frames are also written as Arrow IPC files to a cache directory
+# next to the data file (or SUPPLY_DASHBOARD_CACHE_DIR), under a key made of
+# everything they depend on: the data file's hash, the locations joined onto
+# it from the gazetteer, the source of the code and the name of the result. A restarted server that sees data it has seen before
+# memory-maps those files instead of recomputing. Entries are evicted least
+# recently used first once the cache outgrows its budget.
+DISK_CACHE_DIR = os.environ.get('SUPPLY_DASHBOARD_CACHE_DIR', os.path.join(os.path.dirname(DATA_PATH), 'cache'))
+DISK_CACHE_MAX_BYTES = 512 * 2 ** 20
+DISK_CACHE_SOURCES = [__file__, os.path.join(os.path.dirname(__file__), 'compute.py')]
+
+
+# Hash of the given files' contents
+def files_digest(paths):
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, 'rb') as file:
+            digest.update(file.read())
+    return digest.hexdigest()
+
+
+code_digest = files_digest(DISK_CACHE_SOURCES)
+
+
+# Hash of the location columns joined onto a data version, that is of the
+# gazetteer entries it was read with
+def locations_digest(dataset):
+    hashes = pd.util.hash_pandas_object(dataset.df[GEO_COLUMNS], index=False)
+    return hashlib.sha256(hashes.to_numpy().tobytes()).hexdigest()
+
+
+# A frame, or a tuple or dict of frames, as a manifest and a list of frames
+def cache_parts(value):
+    if isinstance(value, pd.DataFrame):
+        return {'kind': 'frame', 'keys': [0]}, [value]
+    if isinstance(value, tuple):
+        return {'kind': 'tuple', 'keys': list(range(len(value)))}, list(value)
+    return {'kind': 'dict', 'keys': list(value)}, list(value.values())
+
+
+# Write the entry under a temporary name and rename it into place in one step
+def write_cache_entry(path, value):
+    manifest, frames = cache_parts(value)
+    staging = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    os.makedirs(staging)
+    try:
+        for i, frame in enumerate(frames):
+            table = pa.Table.from_pandas(frame)
+            with pa.OSFile(os.path.join(staging, f'{i}.arrow'), 'wb') as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+        with open(os.path.join(staging, 'manifest.json'), 'w') as file:
+            json.dump(manifest, file)
+        os.rename(staging, path)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)  # left over on failure, or another worker stored it first
+
+
+def read_cache_entry(path):
+    with open(os.path.join(path, 'manifest.json')) as file:
+        manifest = json.load(file)
+    frames = [pa.ipc.open_file(pa.memory_map(os.path.join(path, f'{i}.arrow'))).read_all().to_pandas()
+              for i in range(len(manifest['keys']))]
+    os.utime(path)  # the modification time is the entry's last use
+    if manifest['kind'] == 'frame':
+        return frames[0]
+    if manifest['kind'] == 'tuple':
+        return tuple(frames)
+    return dict(zip(manifest['keys'], frames))
+
+
+# Delete the least recently used entries until the cache fits in max_bytes
+def evict_cache(directory, max_bytes):
+    entries = []
+    for entry in os.scandir(directory):
+        if entry.name.endswith('.tmp'):
+            continue
+        try:
+            size = sum(part.stat().st_size for part in os.scandir(entry.path))
+            entries.append((entry.stat().st_mtime, size, entry.path))
+        except OSError:
+            continue  # evicted by another worker
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+
+
+# Decorator for derived results that are frames; the dataset keeps what it
+# returns in memory, so lookups go memory, then disk, then compute
+def disk_cached(compute):
+    @functools.wraps(compute)
+    def cached(dataset):
+        key = (dataset.digest, derived(dataset, locations_digest), code_digest, compute.__name__)
+        path = os.path.join(DISK_CACHE_DIR, hashlib.sha256(repr(key).encode()).hexdigest())
+        if os.path.isdir(path):
+            try:
+                return read_cache_entry(path)
+            except Exception:
+                shutil.rmtree(path, ignore_errors=True)  # unreadable, compute it again
+
+        value = compute(dataset)
+        # The cache only saves time, so a full disk or an unstorable frame is not an error
+        try:
+            os.makedirs(DISK_CACHE_DIR, exist_ok=True)
+            write_cache_entry(path, value)
+            evict_cache(DISK_CACHE_DIR, DISK_CACHE_MAX_BYTES)
+        except (OSError, pa.ArrowException):
+            pass
+        return value
+
+    return cached
+
 
 
 #######################
 # Plots
 
+# Plotly 6 serializes numeric arrays as base64 typed arrays
+# ({'dtype', 'bdata', 'shape'}), which rounding cannot shrink; turn them back
+# into lists, which are sent as JSON text and can be rounded, measured and
+# sliced
+def decode_arrays(obj):
+    if isinstance(obj, dict):
+        if 'bdata' in obj and 'dtype' in obj:
+            values = np.frombuffer(base64.b64decode(obj['bdata']), dtype=obj['dtype'])
+            if obj.get('shape'):
+                values = values.reshape([int(n) for n in str(obj['shape']).split(',')])
+            return values.tolist()
+        return {key: decode_arrays(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [decode_arrays(value) for value in obj]
+    return obj
+
+
+# Round float arrays in a figure dict to display precision
+def round_arrays(obj, decimals=PAYLOAD_DECIMALS):
+    if isinstance(obj, dict):
+        return {key: value if key in PAYLOAD_EXACT_KEYS else round_arrays(value, decimals)
+                for key, value in obj.items()}
+    if isinstance(obj, (list, tuple, np.ndarray)) and len(obj) > 0:
+        values = np.asarray(obj)
+        if values.dtype.kind == 'f':
+            return np.round(values, decimals).tolist()
+        if values.dtype.kind == 'O':
+            return [round(value, decimals) if isinstance(value, float) else round_arrays(value, decimals)
+                    for value in obj]
+    return obj
+
+
+# Drop hover payloads that no template or hover label refers to
+def drop_unused_hover(trace):
+    templates = str(trace.get('hovertemplate', '')) + str(trace.get('texttemplate', ''))
+    if trace.get('hoverinfo') in ('none', 'skip'):
+        for key in ('hovertemplate', 'hovertext', 'customdata'):
+            trace.pop(key, None)
+    elif 'customdata' in trace and 'customdata' not in templates:
+        trace.pop('customdata')
+    return trace
+
+
+# Strip all per-point hover data, keeping only the default x/y labels
+def drop_hover(trace):
+    for key in ('hovertemplate', 'hovertext', 'customdata'):
+        trace.pop(key, None)
+    return trace
+
+
+# Keep every n-th point of the long arrays in a trace
+def decimate_trace(trace, step):
+    lengths = [len(trace[key]) for key in ('x', 'y') if key in trace]
+    if not lengths or max(lengths) < PAYLOAD_MIN_POINTS:
+        return trace
+    n_points = max(lengths)
+    for key, value in list(trace.items()):
+        if isinstance(value, (list, tuple, np.ndarray)) and len(value) == n_points:
+            trace[key] = value[::step]
+        elif key == 'marker' and isinstance(value, dict):
+            trace[key] = {k: (v[::step] if isinstance(v, (list, tuple, np.ndarray)) and len(v) == n_points else v)
+                          for k, v in value.items()}
+    return trace
+
+
+def figure_bytes(fig_dict):
+    return len(pio.to_json(fig_dict, validate=False).encode('utf-8'))
+
+
+# Trim a figure to the payload budget and hand it to Streamlit
+def show_chart(fig, **kwargs):
+    if not payload_budget_mode:
+        st.plotly_chart(fig, **kwargs)
+        return
+
+    title = fig.layout.title.text or 'Untitled chart'
+    original_bytes = figure_bytes(fig)
+
+    fig_dict = decode_arrays(fig.to_dict())
+    traces, seen = [], set()
+    for trace in round_arrays(fig_dict['data']):
+        key = pio.to_json(trace, validate=False)
+        if key in seen:
+            continue
+        seen.add(key)
+        traces.append(drop_unused_hover(trace))
+    fig_dict['data'] = traces
+
+    remaining = PAGE_PAYLOAD_BUDGET - sum(entry['Bytes'] for entry in payload_log)
+    size = figure_bytes(fig_dict)
+    status = 'trimmed'
+    if size > remaining:
+        fig_dict['data'] = [drop_hover(trace) for trace in fig_dict['data']]
+        size = figure_bytes(fig_dict)
+        status = 'hover dropped'
+    if size > remaining > 0:
+        step = math.ceil(size / remaining)
+        fig_dict['data'] = [decimate_trace(trace, step) for trace in fig_dict['data']]
+        size = figure_bytes(fig_dict)
+        status = f'1 in {step} points kept'
+    if size > remaining:
+        st.info(f'"{title}" was left out to keep this page within its payload budget.')
+        payload_log.append({'Chart': title, 'Original': original_bytes, 'Bytes': 0, 'Status': 'omitted'})
+        return
+
+    payload_log.append({'Chart': title, 'Original': original_bytes, 'Bytes': size, 'Status': status})
+    st.plotly_chart(go.Figure(fig_dict), **kwargs)
+
+
+#######################
+# Categorical breakdowns
+BREAKDOWN_TOP_N = 8  # slices kept per facet, the rest are folded into "Other"
+BREAKDOWN_MAX_PIES = 6  # more facets than this switch to a single heatmap
+BREAKDOWN_MAX_ROWS = 40  # heatmap rows kept, the rest are folded into "Other"
+
+BREAKDOWNS = [('Product type', 'Customer demographics'), ('Supplier name', 'Product type'),
+              ('Shipping carriers', 'Product type'), ('Transportation modes', 'Product type')]
+
+# Counts of every index/columns pair in BREAKDOWNS, computed once per data version
+@disk_cached
+def category_crosstabs(dataset):
+    return tuple(pd.crosstab(dataset.df[index], dataset.df[columns]) for index, columns in BREAKDOWNS)
+
+
+def category_crosstab(dataset, index, columns):
+    return derived(dataset, category_crosstabs)[BREAKDOWNS.index((index, columns))]
+
+
+# Keep the n largest rows of a count table and sum the rest into "Other"
+def fold_top_n(table, n):
+    if len(table) <= n:
+        return table
+    keep = table.sum(axis=1).nlargest(n).index
+    other = table.drop(keep).sum().to_frame('Other').T
+    return pd.concat([table.loc[keep], other])
+
+
+# Pie per facet for a few facets, one heatmap of shares above that
+def make_breakdown(table, title):
+    facet, names = table.index.name, table.columns.name
+    table = fold_top_n(table.T, BREAKDOWN_TOP_N).T
+    table.index.name, table.columns.name = facet, names
+
+    if len(table) <= BREAKDOWN_MAX_PIES:
+        melted_df = pd.melt(table.reset_index(), id_vars=[facet],
+                            var_name=names,
+                            value_name='Count')
+        fig = px.pie(melted_df, values='Count', names=names,
+                 facet_col=facet,
+                 title=title,
+                 hole=0.6,
+                 color_discrete_sequence=px.colors.qualitative.Pastel)
+        fig.update_traces(textposition='inside', textinfo='percent+label')
+        return fig
+
+    table = fold_top_n(table, BREAKDOWN_MAX_ROWS)
+    shares = 100 * table.div(table.sum(axis=1), axis=0)
+    fig = go.Figure(go.Heatmap(
+        z=shares.values,
+        x=[str(column) for column in shares.columns],
+        y=[str(row) for row in shares.index],
+        customdata=table.values,
+        texttemplate='%{z:.0f}%',
+        hovertemplate=f'{facet}=%{{y}}<br>{names}=%{{x}}<br>Count=%{{customdata}}<br>Share=%{{z:.1f}}%<extra></extra>',
+        colorscale='Blues',
+        colorbar=dict(title='Share (%)')))
+    fig.update_layout(title=title,
+                      xaxis_title=names,
+                      yaxis_title=facet,
+                      yaxis=dict(autorange='reversed'),
+                      height=max(400, 24 * len(shares)))
+    return fig
+
+
+#######################
+# Shipping scenarios
+# A scenario is a list of reassignment rules applied in order, e.g.
+# [{'match': {'Routes': 'Route C', 'Transportation modes': 'Air'},
+#   'assign': {'Transportation modes': 'Rail'}}]
+# Rules act on (carrier, mode, route) cells, so once the per-cell tables are
+# built a batch of scenarios costs O(scenarios x cells), whatever the row count.
+SHIPPING_KEYS = ['Shipping carriers', 'Transportation modes', 'Routes']
+SHIPPING_METRICS = ['Shipping costs', 'Shipping times', 'Defect rates']
+
+# Per-(carrier, mode, route) SKU counts and mean cost, time and defect rate
+def shipping_tables(dataset):
+    df = dataset.df
+    levels = [np.sort(df[key].unique()) for key in SHIPPING_KEYS]
+    shape = tuple(len(level) for level in levels)
+    codes = [pd.Categorical(df[key], categories=level).codes for key, level in zip(SHIPPING_KEYS, levels)]
+    cells = np.ravel_multi_index(codes, shape)
+
+    count = np.bincount(cells, minlength=np.prod(shape)).reshape(shape)
+    means = {}
+    for metric in SHIPPING_METRICS:
+        total = np.bincount(cells, weights=df[metric], minlength=np.prod(shape)).reshape(shape)
+        # Cells nobody ships through fall back to the mode/route mean, then the mode mean
+        with np.errstate(invalid='ignore', divide='ignore'):
+            cell_mean = total / count
+            mode_route_mean = total.sum(axis=0) / count.sum(axis=0)
+            mode_mean = total.sum(axis=(0, 2)) / count.sum(axis=(0, 2))
+        cell_mean = np.where(count > 0, cell_mean, mode_route_mean[None, :, :])
+        cell_mean = np.where(np.isnan(cell_mean), mode_mean[None, :, None], cell_mean)
+        means[metric] = cell_mean.ravel()
+
+    return {'levels': levels, 'shape': shape, 'count': count.ravel(), 'means': means}
+
+
+# Index of a rule value among the levels of its key, e.g. 'Rail' among the transportation modes
+def level_index(level, key, value):
+    position = np.searchsorted(level, value)
+    if position == len(level) or level[position] != value:
+        raise ValueError(f"unknown {key} {value!r} in shipping scenario, expected one of {', '.join(map(repr, level))}")
+    return position
+
+
+# Totals for a batch of scenarios, one row per scenario
+def evaluate_scenarios(tables, scenarios):
+    levels, shape, count = tables['levels'], tables['shape'], tables['count']
+    n_scenarios, n_rules = len(scenarios), max((len(rules) for rules in scenarios), default=0)
+
+    # Rules as (scenario, rule, key) level indexes, -1 meaning "any" / "keep"
+    match = np.full((n_scenarios, n_rules, len(SHIPPING_KEYS)), -1)
+    assign = np.full((n_scenarios, n_rules, len(SHIPPING_KEYS)), -1)
+    for i, rules in enumerate(scenarios):
+        for j, rule in enumerate(rules):
+            for k, key in enumerate(SHIPPING_KEYS):
+                if key in rule.get('match', {}):
+                    match[i, j, k] = level_index(levels[k], key, rule['match'][key])
+                if key in rule.get('assign', {}):
+                    assign[i, j, k] = level_index(levels[k], key, rule['assign'][key])
+
+    cells = np.arange(count.size)
+    coords = np.stack(np.unravel_index(cells, shape), axis=-1)
+    coords = np.broadcast_to(coords, (n_scenarios,) + coords.shape).copy()
+    for j in range(n_rules):
+        rule_match, rule_assign = match[:, j, None, :], assign[:, j, None, :]
+        matched = ((rule_match < 0) | (coords == rule_match)).all(axis=-1, keepdims=True)
+        coords = np.where(matched & (rule_assign >= 0), rule_assign, coords)
+    target = np.ravel_multi_index(tuple(np.moveaxis(coords, -1, 0)), shape)
+
+    n_skus = count.sum()
+    return pd.DataFrame({
+        'Total shipping cost': (count * tables['means']['Shipping costs'][target]).sum(axis=1),
+        'Average shipping time': (count * tables['means']['Shipping times'][target]).sum(axis=1) / n_skus,
+        'Average defect rate': (count * tables['means']['Defect rates'][target]).sum(axis=1) / n_skus,
+        'SKUs moved': (count * (target != cells)).sum(axis=1),
+    })
+
+
+# Every single-rule move of a mode on a route to another mode, and of a carrier to another carrier
+def single_move_scenarios(tables):
+    carriers, modes, routes = tables['levels']
+    scenarios, labels = [], []
+    for route, mode, new_mode in itertools.product(routes, modes, modes):
+        if mode != new_mode:
+            scenarios.append([{'match': {'Routes': route, 'Transportation modes': mode},
+                               'assign': {'Transportation modes': new_mode}}])
+            labels.append(f'{route} {mode} -> {new_mode}')
+    for carrier, new_carrier in itertools.product(carriers, carriers):
+        if carrier != new_carrier:
+            scenarios.append([{'match': {'Shipping carriers': carrier},
+                               'assign': {'Shipping carriers': new_carrier}}])
+            labels.append(f'{carrier} -> {new_carrier}')
+    return scenarios, labels
+
+
+#######################
+# Inventory planning
+# Demand and lead-time spread per SKU are estimated from the SKU's product
+# type, since the dataset has one row per SKU and no history:
+#   safety stock  = z * sqrt(L * sd_d^2 + d^2 * sd_L^2)
+#   reorder point = d * L + safety stock
+#   days of cover = stock / d
+INVENTORY_TABLE_ROWS = 500  # most urgent SKUs listed on the page
+INVENTORY_PLAN_ENTRIES = 32  # parameter sets kept in memory, across data versions
+
+# Parameter-independent inputs, computed once per data version
+def inventory_inputs(dataset):
+    df = dataset.df
+    by_type = df.groupby('Product type')
+    sold = df['Number of products sold'].to_numpy(dtype=float)
+    sold_cv = (by_type['Number of products sold'].transform('std') /
+               by_type['Number of products sold'].transform('mean')).fillna(0).to_numpy()
+    return {
+        'sold': sold,
+        'sold_cv': sold_cv,
+        'lead': df['Lead times'].to_numpy(dtype=float),
+        'lead_sd': by_type['Lead times'].transform('std').fillna(0).to_numpy(),
+        'stock': df['Stock levels'].to_numpy(dtype=float),
+    }
+
+
+# Reorder point, safety stock and days of cover for every SKU in one pass
+@st.cache_data(max_entries=INVENTORY_PLAN_ENTRIES)
+def inventory_plan(_dataset, data_version, service_level, period_days):
+    df, inputs = _dataset.df, derived(_dataset, inventory_inputs)
+    z = NormalDist().inv_cdf(service_level)
+    demand = inputs['sold'] / period_days
+    demand_sd = inputs['sold_cv'] * demand
+    safety_stock = z * np.sqrt(inputs['lead'] * demand_sd ** 2 + demand ** 2 * inputs['lead_sd'] ** 2)
+    reorder_point = demand * inputs['lead'] + safety_stock
+    with np.errstate(divide='ignore'):
+        days_of_cover = np.where(demand > 0, inputs['stock'] / demand, np.inf)
+
+    return pd.DataFrame({
+        'SKU': df['SKU'],
+        'Product type': df['Product type'],
+        'Stock levels': df['Stock levels'],
+        'Daily demand': demand,
+        'Safety stock': np.ceil(safety_stock),
+        'Reorder point': np.ceil(reorder_point),
+        'Days of cover': days_of_cover,
+        'Reorder now': inputs['stock'] <= reorder_point,
+        'Order quantities': df['Order quantities'],
+    })
+
+
+#######################
+# Cost-to-serve rollups
+# Cost to serve = manufacturing costs + shipping costs + other costs ('Costs'),
+# margin = revenue generated - cost to serve. Every level of the hierarchy is
+# summed once per data version; drilling down is an index lookup.
+COST_HIERARCHY = ['Product type', 'Supplier name', 'Location', 'SKU']
+COST_COLUMNS = ['Revenue generated', 'Manufacturing costs', 'Shipping costs', 'Costs']
+
+def add_margin(rollup):
+    rollup = rollup.copy()
+    rollup['Cost to serve'] = rollup['Manufacturing costs'] + rollup['Shipping costs'] + rollup['Costs']
+    rollup['Margin'] = rollup['Revenue generated'] - rollup['Cost to serve']
+    rollup['Margin %'] = 100 * rollup['Margin'] / rollup['Revenue generated']
+    return rollup
+
+
+# Sums at every depth of the hierarchy, depth 0 being the whole catalog
+@disk_cached
+def cost_rollups(dataset):
+    df = dataset.df
+    level = df.assign(SKUs=1).groupby(COST_HIERARCHY)[COST_COLUMNS + ['SKUs']].sum()
+    rollups = {len(COST_HIERARCHY): add_margin(level)}
+    for depth in range(len(COST_HIERARCHY) - 1, 0, -1):
+        level = level.groupby(level=list(range(depth))).sum()
+        rollups[depth] = add_margin(level)
+    rollups[0] = add_margin(level.sum().to_frame('All').T)
+    return rollups
+
+
+# Totals of a node and of its children, path being e.g. ('skincare', 'Supplier 1')
+def cost_node(rollups, path):
+    if not path:
+        return rollups[0].iloc[0], rollups[1]
+    key = path[0] if len(path) == 1 else path
+    return rollups[len(path)].loc[key], rollups[len(path) + 1].loc[path]
+
+
+#######################
+# KPI snapshots
+# The KPIs and per-dimension aggregates of every data version are appended to
+# a small Parquet file next to the data file, keyed by its hash, so deltas
+# and trends against earlier versions never need the old raw data.
+SNAPSHOT_PATH = os.path.join(os.path.dirname(DATA_PATH), 'snapshots.parquet')
+SNAPSHOT_DIMENSIONS = ['Product type', 'Supplier name', 'Location', 'Shipping carriers', 'Transportation modes', 'Routes']
+SNAPSHOT_METRICS = {'Revenue generated': 'sum', 'Number of products sold': 'sum', 'Lead times': 'mean', 'Defect rates': 'mean'}
+
+# One data version in long format, KPIs having an empty dimension and key
+def snapshot_rows(df, digest, taken_at):
+    frames = [df.agg(SNAPSHOT_METRICS).rename_axis('metric').reset_index(name='value').assign(dimension='', key='')]
+    for dimension in SNAPSHOT_DIMENSIONS:
+        grouped = df.groupby(dimension).agg(SNAPSHOT_METRICS).rename_axis('key').reset_index()
+        frames.append(grouped.melt(id_vars='key', var_name='metric', value_name='value').assign(dimension=dimension))
+    rows = pd.concat(frames, ignore_index=True).assign(snapshot=digest, taken_at=pd.Timestamp(taken_at, unit='s'))
+    rows['key'] = rows['key'].astype(str)
+    return rows[['snapshot', 'taken_at', 'dimension', 'key', 'metric', 'value']]
+
+
+# Append a data version to the store unless it is already there; runs once per
+# version, when it is loaded. False when the store cannot be read or written.
+def record_snapshot(dataset, path=SNAPSHOT_PATH):
+    rows = snapshot_rows(dataset.df, dataset.digest, time.time())
+    staging = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        if os.path.exists(path):
+            snapshots = pd.read_parquet(path)
+            if dataset.digest in set(snapshots['snapshot']):
+                return True
+            rows = pd.concat([snapshots, rows], ignore_index=True)
+        rows.to_parquet(staging, index=False)
+        os.replace(staging, path)
+    except (OSError, pa.ArrowException):
+        if os.path.exists(staging):
+            os.remove(staging)
+        return False
+    return True
+
+
+@st.cache_data(max_entries=4)
+def load_snapshots(path, modified):
+    return pd.read_parquet(path)
+
+
+# The snapshot store, or None when it is unavailable
+def read_snapshots(dataset, path=SNAPSHOT_PATH):
+    if not derived(dataset, record_snapshot):
+        return None
+    try:
+        return load_snapshots(path, os.path.getmtime(path))
+    except (OSError, pa.ArrowException):
+        return None
+
+
+# KPI values per snapshot, oldest first
+def snapshot_kpis(snapshots):
+    kpis = snapshots[snapshots['dimension'] == '']
+    return kpis.pivot_table(index=['taken_at', 'snapshot'], columns='metric', values='value').reset_index()
+
+
+# Signed delta string, with the sign in front so st.metric colours it correctly
+def format_delta(value, prefix='', decimals=0):
+    if value is None:
+        return None
+    return f"{'-' if value < 0 else ''}{prefix}{abs(value):,.{decimals}f}"
+
+
+# Trend line of one KPI across snapshots
+def make_sparkline(kpis, metric):
+    return alt.Chart(kpis).mark_line(point=True, color='#29b5e8').encode(
+        x=alt.X('taken_at:T', axis=None),
+        y=alt.Y(f'{metric}:Q', axis=None, scale=alt.Scale(zero=False)),
+        tooltip=[alt.Tooltip('taken_at:T', title='Snapshot'), alt.Tooltip(f'{metric}:Q', format=',.2f')],
+    ).properties(width=130, height=40)
+
+
+#######################
+# ABC analysis
+# SKUs by revenue, descending, with cumulative shares and their ABC class,
+# computed once per data version
+@disk_cached
+def abc_analysis(dataset):
+    df = dataset.df
+    total_revenue = df['Revenue generated'].sum()
+    df_sorted = df.sort_values(by='Revenue generated', ascending=False)
+    df_sorted['Cumulative Revenue'] = df_sorted['Revenue generated'].cumsum()
+    df_sorted['Cumulative Revenue Percentage'] = 100 * df_sorted['Cumulative Revenue'] / total_revenue
+
+    percentage = df_sorted['Cumulative Revenue Percentage']
+    df_sorted['ABC_category'] = np.select([percentage <= 70, percentage <= 90], ['A', 'B'], default='C')
+
+    # Compute Cumulative Percentage of Items
+    df_sorted['Item Number'] = range(1, len(df_sorted) + 1)
+    df_sorted['Cumulative Items Percentage'] = 100 * df_sorted['Item Number'] / len(df_sorted)
+    return df_sorted
+
+
+#######################
+# Fast preview
+# Opt-in: exploratory views run on a sample stratified by product type,
+# supplier and ABC class, drawn once per data version. Each sampled SKU
+# stands for "Weight" SKUs of its stratum; totals are estimated with the
+# stratified estimator and shown with a 95% confidence interval.
+PREVIEW_FRACTION = 0.05
+PREVIEW_MIN_PER_STRATUM = 2  # a within-stratum variance needs two rows
+PREVIEW_STRATA = ['Product type', 'Supplier name', 'ABC_category']
+PREVIEW_Z = 1.96
+PREVIEW_ENTRIES = 4  # samples kept in memory, across data versions
+
+@st.cache_data(max_entries=PREVIEW_ENTRIES)
+def stratified_sample(_dataset, data_version, fraction, seed=0):
+    df_sorted = derived(_dataset, abc_analysis)
+    strata = df_sorted.groupby(PREVIEW_STRATA, sort=False)
+    stratum_size = strata['SKU'].transform('size')
+    stratum_sample = np.minimum(stratum_size, np.maximum(np.ceil(stratum_size * fraction), PREVIEW_MIN_PER_STRATUM))
+
+    # A random rank within each stratum picks the rows, keeping the revenue order
+    noise = pd.Series(np.random.default_rng(seed).random(len(df_sorted)), index=df_sorted.index)
+    rank = noise.groupby([df_sorted[column] for column in PREVIEW_STRATA], sort=False).rank(method='first')
+    keep = rank <= stratum_sample
+    return df_sorted[keep].assign(**{'Stratum size': stratum_size[keep],
+                                     'Stratum sample': stratum_sample[keep],
+                                     'Weight': (stratum_size / stratum_sample)[keep]})
+
+
+# Variance of the estimated population total of per-row values
+def stratified_variance(sample, values):
+    stats = values.groupby([sample[column] for column in PREVIEW_STRATA], sort=False).agg(['var', 'size'])
+    sizes = sample.groupby(PREVIEW_STRATA, sort=False)['Stratum size'].first()
+    n, N = stats['size'], sizes.reindex(stats.index)
+    return (N ** 2 * (1 - n / N) * stats['var'].fillna(0) / n).sum()
+
+
+# Estimated total of a column, optionally within a subset, with its 95% half-width
+def stratified_total(sample, column, mask=True):
+    values = sample[column] * mask
+    return (sample['Weight'] * values).sum(), PREVIEW_Z * math.sqrt(stratified_variance(sample, values))
+
+
+# Estimated share (%) of a column's total that falls in a subset, with its 95% half-width
+def stratified_share(sample, column, mask):
+    total, _ = stratified_total(sample, column)
+    share = stratified_total(sample, column, mask)[0] / total
+    residuals = sample[column] * (mask - share)
+    return 100 * share, 100 * PREVIEW_Z * math.sqrt(stratified_variance(sample, residuals)) / total
+
+
+# Cumulative items/revenue percentages estimated from a revenue-sorted sample
+def preview_curve(sample):
+    weights = sample['Weight']
+    return pd.DataFrame({
+        'Cumulative Items Percentage': 100 * weights.cumsum() / weights.sum(),
+        'Cumulative Revenue Percentage': 100 * (weights * sample['Revenue generated']).cumsum()
+                                         / (weights * sample['Revenue generated']).sum(),
+    })
+
+
+# Subtitle under a chart's title
+def annotate_preview(fig, note):
+    fig.update_layout(title=dict(text=f'{fig.layout.title.text}<br><sup>{note}</sup>'))
+    return fig
+
+
+#######################
+# Supplier scorecard
+# Per-supplier metrics as (source column, aggregation, higher is better)
+SCORECARD_METRICS = {
+    'Products sold': ('Number of products sold', 'sum', True),
+    'Revenue': ('Revenue generated', 'sum', True),
+    'Manufacturing lead time': ('Manufacturing lead time', 'mean', False),
+    'Defect rate': ('Defect rates', 'mean', False),
+    'Inspection pass rate': ('Inspection passed', 'mean', True),
+    'Production volume': ('Production volumes', 'sum', True),
+}
+SCORECARD_CHART_ROWS = 25  # suppliers drawn in the score chart
+
+# Supplier metrics and their 0-1 normalized form (1 = best), once per data version
+@disk_cached
+def supplier_scorecard(dataset):
+    df = dataset.df
+    passed = df.assign(**{'Inspection passed': df['Inspection results'].eq('Pass')})
+    metrics = passed.groupby('Supplier name').agg(**{name: (column, how) for name, (column, how, _) in SCORECARD_METRICS.items()})
+    spread = (metrics.max() - metrics.min()).replace(0, 1)
+    normalized = (metrics - metrics.min()) / spread
+    lower_is_better = [name for name, (_, _, higher) in SCORECARD_METRICS.items() if not higher]
+    normalized[lower_is_better] = 1 - normalized[lower_is_better]
+    return metrics, normalized
+
+
+# Weighted score (0-100) and rank of every supplier, a single matrix product
+def rank_suppliers(metrics, normalized, weights):
+    weights = np.array([weights[name] for name in normalized.columns], dtype=float)
+    score = 100 * normalized.to_numpy() @ weights / weights.sum()
+    ranked = metrics.assign(Score=score).sort_values('Score', ascending=False)
+    ranked.insert(0, 'Rank', range(1, len(ranked) + 1))
+    return ranked.reset_index()
+
+
 # Choropleth map
-def make_choropleth(df):
-    city_to_state = {
-    'Kolkata': 'West Bengal',
-    'Mumbai': 'Maharashtra',
-    'Chennai': 'Tamil Nadu',
-    'Bangalore': 'Karnataka',
-    'Delhi': 'Delhi'}
-
-    # Add the new 'State' column using the map function
-    df['State'] = df['Location'].map(city_to_state)
+def make_choropleth(frame):
     state_column = 'State'
     value_column = 'Revenue generated'
     # Group by state and sum the revenue
-    state_revenue = df.groupby(state_column)[value_column].sum().reset_index()
+    state_revenue = aggregate(frame, state_column, value_column, 'sum')
 
     choropleth = px.choropleth(
         state_revenue,
@@ -87,6 +946,50 @@ def make_choropleth(df):
     return choropleth
 
 
+# Point map of sites, sized by revenue
+def make_site_map(df):
+    sites = df.dropna(subset=['Latitude', 'Longitude']).groupby('Location', observed=True).agg(
+        **{'Revenue generated': ('Revenue generated', 'sum'),
+           'SKUs': ('SKU', 'size'),
+           'State': ('State', 'first'),
+           'Latitude': ('Latitude', 'first'),
+           'Longitude': ('Longitude', 'first')}).reset_index()
+
+    site_map = px.scatter_geo(
+        sites,
+        lat='Latitude',
+        lon='Longitude',
+        size='Revenue generated',
+        color='Revenue generated',
+        hover_name='Location',
+        hover_data={'State': True, 'SKUs': True, 'Latitude': False, 'Longitude': False},
+        labels={'Revenue generated': 'Total Revenue Generated'},
+        scope='asia'
+    )
+
+    site_map.update_geos(
+        fitbounds="locations",
+        visible=True,
+        resolution=50,
+        showcoastlines=True,
+        showsubunits=True,
+        showland=True,
+        showcountries=True,
+        countrycolor="White",
+        subunitcolor="White"
+    )
+
+    site_map.update_layout(
+        template='plotly_dark',
+        plot_bgcolor='rgba(0, 0, 0, 0)',
+        paper_bgcolor='rgba(0, 0, 0, 0)',
+        margin=dict(l=0, r=0, t=0, b=0),
+        height=600
+    )
+
+    return site_map
+
+
 # Donut chart
 def make_donut(input_df, input_metric,):
     metric = input_df.mean()
@@ -135,6 +1038,19 @@ def make_donut(input_df, input_metric,):
 
 
 
+#######################
+# Derived results built in the background before a new data version is swapped in
+# (the snapshot last, so a version that fails to build is not recorded)
+dataset_store(DATA_PATH).builders = [category_crosstabs, abc_analysis, shipping_tables, inventory_inputs, cost_rollups,
+                                    supplier_scorecard]
+if COMPUTE_BACKEND == 'polars':
+    dataset_store(DATA_PATH).builders.append(lazy_frame)
+dataset_store(DATA_PATH).builders.append(record_snapshot)
+
+# The first data version is loaded before the builders are known; snapshot it now
+derived(dataset, record_snapshot)
+
+
 #######################
 
 
@@ -152,27 +1068,57 @@ if visualization == "Main Dashboard":
         st.write('\n\n')  # Adds two empty lines
 
         st.markdown('##### Key Metrics')
-        
+
+        # Deltas and trends come from the stored snapshots of earlier data versions
+        snapshots = read_snapshots(dataset)
+        if snapshots is None:
+            kpis = previous = pd.DataFrame()
+            st.caption(f'KPI snapshots in {SNAPSHOT_PATH} are unavailable, so no deltas are shown.')
+        else:
+            kpis = snapshot_kpis(snapshots)
+            previous = kpis[kpis['snapshot'] != dataset.digest].sort_values('taken_at', ascending=False)
+        if len(previous):
+            taken_at = dict(zip(previous['snapshot'], previous['taken_at']))
+            compare_to = st.selectbox('Compared with', list(taken_at),
+                                      format_func=lambda snapshot: taken_at[snapshot].strftime('%Y-%m-%d %H:%M:%S'))
+            baseline = previous[previous['snapshot'] == compare_to].iloc[0]
+        else:
+            baseline = None
+            if snapshots is not None:
+                st.caption('No earlier snapshot to compare with yet.')
+
+        def kpi_delta(metric, value):
+            return None if baseline is None else value - baseline[metric]
+
         st.write('\n\n')  # Adds two empty lines
 
         #Total Revenue
         total_revenue = df['Revenue generated'].sum()
         formatted_revenue = f"$ {total_revenue:,.0f}"
-        st.metric(label = "Total Revenue", value = formatted_revenue, delta='$ 153,524')
+        st.metric(label = "Total Revenue", value = formatted_revenue,
+                  delta=format_delta(kpi_delta('Revenue generated', total_revenue), prefix='$ '))
+        if len(kpis) > 1:
+            st.altair_chart(make_sparkline(kpis, 'Revenue generated'))
                 
         st.write('\n\n')  # Adds two empty lines
         
         #Products Sold
         product_sold = df['Number of products sold'].sum()
         formatted_product = f"{product_sold:,.0f}"
-        st.metric(label = "Items Sold", value = formatted_product, delta='17,093')
+        st.metric(label = "Items Sold", value = formatted_product,
+                  delta=format_delta(kpi_delta('Number of products sold', product_sold)))
+        if len(kpis) > 1:
+            st.altair_chart(make_sparkline(kpis, 'Number of products sold'))
                 
         st.write('\n\n')  # Adds two empty lines
 
         #Average Lead Time
         avr_lead = df['Lead times'].mean()
         formatted_lead = f"{avr_lead:,.0f}"
-        st.metric(label = "Average Lead Time (Days)", value = formatted_lead, delta='-3')
+        st.metric(label = "Average Lead Time (Days)", value = formatted_lead,
+                  delta=format_delta(kpi_delta('Lead times', avr_lead), decimals=1), delta_color='inverse')
+        if len(kpis) > 1:
+            st.altair_chart(make_sparkline(kpis, 'Lead times'))
                 
         st.write('\n\n')  # Adds two empty lines
         
@@ -187,8 +1133,17 @@ if visualization == "Main Dashboard":
 
         st.markdown('<h5 style="text-align: center;">Supplier Geography by Revenue</h5>', unsafe_allow_html=True)
         
-        choropleth = make_choropleth(df)
-        st.plotly_chart(choropleth, use_container_width=True)
+        map_mode = st.radio('Map', ['States', 'Sites'], horizontal=True, label_visibility='collapsed')
+        if map_mode == 'States':
+            choropleth = make_choropleth(compute_df)
+            show_chart(choropleth, use_container_width=True)
+        else:
+            site_map = make_site_map(df)
+            show_chart(site_map, use_container_width=True)
+
+        unmapped = df.loc[df['State'].isna(), 'Location'].dropna().unique()
+        if len(unmapped):
+            st.caption(f"Not on the map (missing from {GAZETTEER_PATH}): {', '.join(sorted(map(str, unmapped)))}")
 
         st.write('\n\n')  # Adds two empty lines
         st.write('\n\n')  # Adds two empty lines
@@ -196,6 +1151,21 @@ if visualization == "Main Dashboard":
         st.write('\n\n')  # Adds two empty lines
 
 
+        with st.expander('Changes by Dimension', expanded=False):
+            if baseline is None:
+                st.write('No earlier snapshot to compare with yet.')
+            else:
+                dimension = st.selectbox('Dimension', SNAPSHOT_DIMENSIONS)
+                metric = st.selectbox('Metric', list(SNAPSHOT_METRICS))
+                rows = snapshots[(snapshots['dimension'] == dimension) & (snapshots['metric'] == metric)]
+                changes = rows.pivot_table(index='key', columns='snapshot', values='value').reindex(
+                    columns=[dataset.digest, baseline['snapshot']])
+                changes.columns = ['Current', 'Compared']
+                changes['Change'] = changes['Current'] - changes['Compared']
+                st.dataframe(changes.rename_axis(dimension).sort_values('Change'), use_container_width=True)
+
+        st.write('\n\n')  # Adds two empty lines
+
         with st.expander('About the Developer', expanded=False):
             st.write('''
             - This Dashboard was developed by Abdullah Garatli''')
@@ -203,7 +1173,13 @@ if visualization == "Main Dashboard":
         st.write('\n\n')  # Adds two empty lines
 
         with st.expander('The Dataset', expanded=False):
-            st.write(df)
+            if fast_preview:
+                sample = stratified_sample(dataset, data_version, PREVIEW_FRACTION)
+                st.caption(f'Preview: {len(sample):,} of {len(df):,} SKUs, stratified by product type, supplier '
+                           f'and ABC class. "Weight" is the number of SKUs each row stands for.')
+                st.write(sample[list(df.columns) + ['Weight']])
+            else:
+                st.write(df)
 
         st.write('\n\n')  # Adds two empty lines
 
@@ -256,7 +1232,7 @@ elif visualization == "Product Type Analytics":
 
     with col[0]:
             #Number of products sold by Product Type
-            pr_num_tot = df.groupby('Product type')['Number of products sold'].sum().reset_index()
+            pr_num_tot = aggregate(compute_df, 'Product type', 'Number of products sold', 'sum')
             color_sequence = px.colors.qualitative.Vivid
             colors = list(itertools.islice(itertools.cycle(color_sequence), len(pr_num_tot)))
             fig = go.Figure()
@@ -267,7 +1243,7 @@ elif visualization == "Product Type Analytics":
             fig.update_layout(title='Products Sold by Product Type', 
                             xaxis_title='Product Type', 
                             yaxis_title='Products Sold')
-            st.plotly_chart(fig)
+            show_chart(fig)
 
             # Update layout if necessary
             fig.update_layout(
@@ -280,7 +1256,7 @@ elif visualization == "Product Type Analytics":
             st.write('\n\n')  # Adds two empty lines
 
             #Sales Volume by Product Type
-            pr_num_per = df.groupby('Product type')['Number of products sold'].sum().reset_index()
+            pr_num_per = aggregate(compute_df, 'Product type', 'Number of products sold', 'sum')
             pie_chart = px.pie(pr_num_per, values='Number of products sold', names='Product type', 
                         title='Sales Volume by Product Type', 
                         hover_data=['Number of products sold'],
@@ -288,12 +1264,12 @@ elif visualization == "Product Type Analytics":
                         color_discrete_sequence=px.colors.qualitative.Pastel)
 
             pie_chart.update_traces(textposition='inside', textinfo='percent+label')
-            st.plotly_chart(pie_chart)
+            show_chart(pie_chart)
 
 
     with col[1]:
             #Average Price by Product Type
-            pr_pri = df.groupby('Product type')['Price'].mean().reset_index()
+            pr_pri = aggregate(compute_df, 'Product type', 'Price', 'mean')
             color_sequence = px.colors.qualitative.Vivid
             colors = list(itertools.islice(itertools.cycle(color_sequence), len(pr_pri)))
             fig = go.Figure()
@@ -304,11 +1280,11 @@ elif visualization == "Product Type Analytics":
             fig.update_layout(title='Average Price by Product Type', 
                             xaxis_title='Product Type', 
                             yaxis_title='Average Price')
-            st.plotly_chart(fig)
+            show_chart(fig)
     
     with col[2]:
             #Revenue generated by Product Type
-            pr_rev_tot = df.groupby('Product type')['Revenue generated'].sum().reset_index()
+            pr_rev_tot = aggregate(compute_df, 'Product type', 'Revenue generated', 'sum')
             color_sequence = px.colors.qualitative.Vivid
             colors = list(itertools.islice(itertools.cycle(color_sequence), len(pr_rev_tot)))
             fig = go.Figure()
@@ -319,13 +1295,13 @@ elif visualization == "Product Type Analytics":
             fig.update_layout(title='Revenue generated by Product Type', 
                             xaxis_title='Product Type', 
                             yaxis_title='Revenue generated')
-            st.plotly_chart(fig)
+            show_chart(fig)
 
             st.write('\n\n')  # Adds two empty lines
             st.write('\n\n')  # Adds two empty lines
 
             #Revenue Percentage by Product Type
-            pr_rev_per = df.groupby('Product type')['Revenue generated'].sum().reset_index()
+            pr_rev_per = aggregate(compute_df, 'Product type', 'Revenue generated', 'sum')
             pie_chart = px.pie(pr_rev_per, values='Revenue generated', names='Product type', 
                         title='Revenue Percentage by Product Type', 
                         hover_data=['Revenue generated'],
@@ -333,27 +1309,16 @@ elif visualization == "Product Type Analytics":
                         color_discrete_sequence=px.colors.qualitative.Pastel)
 
             pie_chart.update_traces(textposition='inside', textinfo='percent+label')
-            st.plotly_chart(pie_chart)
+            show_chart(pie_chart)
     
     st.write('\n\n')  # Adds two empty lines
     st.write('\n\n')  # Adds two empty lines
 
     #Customer Demographics by Product Type
-    pr_cos = pd.crosstab(df['Product type'], df['Customer demographics'])
-    pr_cos = pr_cos.reset_index()
-
-    melted_df = pd.melt(pr_cos, id_vars=['Product type'], 
-                        var_name='Customer demographics', 
-                        value_name='Count')
-    fig = px.pie(melted_df, values='Count', names='Customer demographics', 
-             facet_col='Product type', 
-             title='Customer Demographics Distribution by Product Type',
-             hole=0.6,
-             color_discrete_sequence=px.colors.qualitative.Pastel)
-
-    fig.update_traces(textposition='inside', textinfo='percent+label')
+    pr_cos = category_crosstab(dataset, 'Product type', 'Customer demographics')
+    fig = make_breakdown(pr_cos, 'Customer Demographics Distribution by Product Type')
 
-    st.plotly_chart(fig)
+    show_chart(fig)
 
 
 
@@ -371,24 +1336,9 @@ elif visualization == "ABC Analysis":
     st.write('\n\n')  # Adds two empty lines  
 
     # Perform ABC Analysis
-    total_revenue = df['Revenue generated'].sum()
-    df_sorted = df.sort_values(by='Revenue generated', ascending=False)
-    df_sorted['Cumulative Revenue'] = df_sorted['Revenue generated'].cumsum()
-    df_sorted['Cumulative Revenue Percentage'] = 100 * df_sorted['Cumulative Revenue'] / total_revenue
-
-    def assign_abc_category(percentage):
-        if percentage <= 70:
-            return 'A'
-        elif percentage <= 90:
-            return 'B'
-        else:
-            return 'C'
-
-    df_sorted['ABC_category'] = df_sorted['Cumulative Revenue Percentage'].apply(assign_abc_category)
-
-    # Compute Cumulative Percentage of Items
-    df_sorted['Item Number'] = range(1, len(df_sorted) + 1)
-    df_sorted['Cumulative Items Percentage'] = 100 * df_sorted['Item Number'] / len(df_sorted)
+    df_sorted = derived(dataset, abc_analysis)
+    if fast_preview:
+        sample = stratified_sample(dataset, data_version, PREVIEW_FRACTION)
 
     # Sidebar Filters
     st.sidebar.header('🔎 Filters')
@@ -419,7 +1369,10 @@ elif visualization == "ABC Analysis":
     # Cumulative Percentage Curve Visualization
 
     # Actual Cumulative Curve
-    actual_curve = df_sorted[['Cumulative Items Percentage', 'Cumulative Revenue Percentage']].copy()
+    if fast_preview:
+        actual_curve = preview_curve(sample)
+    else:
+        actual_curve = df_sorted[['Cumulative Items Percentage', 'Cumulative Revenue Percentage']].copy()
 
     # Theoretical Curve Data
     theoretical_curve = pd.DataFrame({
@@ -505,8 +1458,12 @@ elif visualization == "ABC Analysis":
         ),
         hovermode='x unified'
     )
+    if fast_preview:
+        share, share_ci = stratified_share(sample, 'Revenue generated', sample['ABC_category'] == 'A')
+        annotate_preview(fig_curve, f'Preview on {len(sample):,} of {len(df_sorted):,} SKUs · '
+                                    f'class A revenue share {share:.1f}% ± {share_ci:.1f}% (95% CI)')
 
-    st.plotly_chart(fig_curve, use_container_width=True)
+    show_chart(fig_curve, use_container_width=True)
 
 
 
@@ -525,7 +1482,7 @@ elif visualization == "ABC Analysis":
         )
         fig_revenue.update_traces(texttemplate='%{text:.2f}%', textposition='outside')
         fig_revenue.update_layout(showlegend=False)
-        st.plotly_chart(fig_revenue, use_container_width=True)
+        show_chart(fig_revenue, use_container_width=True)
 
     with col[1]:
         # Stock Levels Pie Chart
@@ -540,7 +1497,7 @@ elif visualization == "ABC Analysis":
             color_discrete_sequence=px.colors.qualitative.Pastel
         )
         fig_stock.update_traces(textinfo='percent+label')
-        st.plotly_chart(fig_stock, use_container_width=True)
+        show_chart(fig_stock, use_container_width=True)
 
 
 
@@ -556,11 +1513,17 @@ elif visualization == "ABC Analysis":
             title='Average Lead Time by ABC Category',
             color_discrete_sequence=px.colors.qualitative.Vivid
         )
-        st.plotly_chart(fig_lead_time, use_container_width=True)
+        show_chart(fig_lead_time, use_container_width=True)
 
     # Revenue vs Stock Levels Scatter Plot
+    if fast_preview:
+        in_filter = (sample['Product type'].isin(selected_product_types) &
+                     sample['ABC_category'].isin(selected_abc_categories))
+        scatter_source = sample[in_filter]
+    else:
+        scatter_source = df_filtered
     fig_scatter = px.scatter(
-        df_filtered,
+        scatter_source,
         x='Stock levels',
         y='Revenue generated',
         color='ABC_category',
@@ -570,7 +1533,11 @@ elif visualization == "ABC Analysis":
         title='Revenue vs Stock Levels',
         color_discrete_sequence=px.colors.qualitative.Vivid
     )
-    st.plotly_chart(fig_scatter, use_container_width=True)
+    if fast_preview:
+        revenue, revenue_ci = stratified_total(sample, 'Revenue generated', in_filter)
+        annotate_preview(fig_scatter, f'Preview on {len(scatter_source):,} of {len(df_filtered):,} SKUs · '
+                                      f'total revenue $ {revenue:,.0f} ± {revenue_ci:,.0f} (95% CI)')
+    show_chart(fig_scatter, use_container_width=True)
     
     
     # Detailed ABC Analysis Table
@@ -592,7 +1559,7 @@ elif visualization == "Supplier Analytics":
 
     with col[0]:
             #Number of products sold
-            pr_num_sup = df.groupby('Supplier name')['Number of products sold'].sum().reset_index()
+            pr_num_sup = aggregate(compute_df, 'Supplier name', 'Number of products sold', 'sum')
             color_sequence = px.colors.qualitative.Vivid
             colors = list(itertools.islice(itertools.cycle(color_sequence), len(pr_num_sup)))
 
@@ -603,7 +1570,7 @@ elif visualization == "Supplier Analytics":
             fig.update_layout(title='Number of Products Sold by Supplier', 
                             xaxis_title='Supplier', 
                             yaxis_title='Number of products sold')
-            st.plotly_chart(fig)
+            show_chart(fig)
 
             st.write('\n\n')  # Adds two empty lines
             st.write('\n\n')  # Adds two empty lines
@@ -613,7 +1580,7 @@ elif visualization == "Supplier Analytics":
 
     with col[1]:
             #Revenue generated
-            rev_sup = df.groupby('Supplier name')['Revenue generated'].sum().reset_index()
+            rev_sup = aggregate(compute_df, 'Supplier name', 'Revenue generated', 'sum')
             fig = go.Figure()   
             fig.add_trace(go.Bar(x=rev_sup['Supplier name'], 
                                 y=rev_sup['Revenue generated'],
@@ -621,11 +1588,11 @@ elif visualization == "Supplier Analytics":
             fig.update_layout(title='Revenue Generated by Supplier', 
                             xaxis_title='Supplier', 
                             yaxis_title='Revenue Generated')
-            st.plotly_chart(fig)
+            show_chart(fig)
 
     with col[2]:
             #Manufacturing Lead Time
-            mlt_sup = df.groupby('Supplier name')['Manufacturing lead time'].mean().reset_index()
+            mlt_sup = aggregate(compute_df, 'Supplier name', 'Manufacturing lead time', 'mean')
             fig = go.Figure()   
             fig.add_trace(go.Bar(x=mlt_sup['Supplier name'], 
                                 y=mlt_sup['Manufacturing lead time'],
@@ -633,14 +1600,14 @@ elif visualization == "Supplier Analytics":
             fig.update_layout(title='Manufacturing Lead Time by Supplier', 
                             xaxis_title='Supplier', 
                             yaxis_title='Manufacturing Lead Time')
-            st.plotly_chart(fig)
+            show_chart(fig)
     
     st.write('\n\n')  # Adds two empty lines
     st.write('\n\n')  # Adds two empty lines
 
 
     #Defect Rate
-    defect_by_supplier = df.groupby('Supplier name')['Defect rates'].mean().reset_index()
+    defect_by_supplier = aggregate(compute_df, 'Supplier name', 'Defect rates', 'mean')
 
     # Sort suppliers by defect rate for better visualization
     defect_by_supplier = defect_by_supplier.sort_values('Defect rates', ascending=True)
@@ -662,27 +1629,63 @@ elif visualization == "Supplier Analytics":
     fig.update_xaxes(tickformat='..2f}%')
 
     # Display the chart in Streamlit
-    st.plotly_chart(fig)
+    show_chart(fig)
 
     st.write('\n\n')  # Adds two empty lines
     st.write('\n\n')  # Adds two empty lines
 
     #Product Type by Supplier
-    pr_cos = pd.crosstab(df['Supplier name'], df['Product type'])
-    pr_cos = pr_cos.reset_index()
+    pr_cos = category_crosstab(dataset, 'Supplier name', 'Product type')
+    fig = make_breakdown(pr_cos, 'Product Type by Supplier')
 
-    melted_df = pd.melt(pr_cos, id_vars=['Supplier name'], 
-                        var_name='Product type', 
-                        value_name='Count')
-    fig = px.pie(melted_df, values='Count', names='Product type', 
-             facet_col='Supplier name', 
-             title='Product Type by Supplier',
-             hole=0.6,
-             color_discrete_sequence=px.colors.qualitative.Pastel)
+    show_chart(fig)
 
-    fig.update_traces(textposition='inside', textinfo='percent+label')
+    st.write('\n\n')  # Adds two empty lines
+    st.write('\n\n')  # Adds two empty lines
+
+    #Supplier Scorecard
+    st.markdown('##### Supplier Scorecard')
+    metrics, normalized = derived(dataset, supplier_scorecard)
+
+    col = st.columns(len(SCORECARD_METRICS), gap='medium')
+    weights = {}
+    for i, name in enumerate(SCORECARD_METRICS):
+        with col[i]:
+            weights[name] = st.slider(f'{name} weight', min_value=0, max_value=5, value=1, key=f'weight_{name}')
 
-    st.plotly_chart(fig)
+    if sum(weights.values()) == 0:
+        st.warning('Give at least one metric a weight to rank suppliers.')
+    else:
+        ranked = rank_suppliers(metrics, normalized, weights)
+
+        top = ranked.head(SCORECARD_CHART_ROWS).sort_values('Score')
+        fig = px.bar(top,
+                     x='Score',
+                     y='Supplier name',
+                     orientation='h',
+                     color='Score',
+                     color_continuous_scale='Tealgrn',
+                     range_x=[0, 100],
+                     title='Supplier Score',
+                     labels={'Supplier name': 'Supplier'},
+                     text='Score')
+        fig.update_traces(texttemplate='%{text:.1f}', textposition='outside')
+        fig.update_layout(coloraxis_showscale=False)
+        show_chart(fig, use_container_width=True)
+
+        st.dataframe(
+            ranked,
+            hide_index=True,
+            height=300,
+            use_container_width=True,
+            column_config={
+                'Score': st.column_config.ProgressColumn('Score', format='%.1f', min_value=0, max_value=100),
+                'Revenue': st.column_config.NumberColumn(format='$ %.0f'),
+                'Manufacturing lead time': st.column_config.NumberColumn(format='%.1f'),
+                'Defect rate': st.column_config.NumberColumn(format='%.2f%%'),
+                'Inspection pass rate': st.column_config.NumberColumn(format='%.2f'),
+            }
+        )
 
 
 
@@ -700,7 +1703,7 @@ elif visualization == "Shipping Analytics":
 
     with col[0]:
             #Number of products sold by Shipping Carrier
-            pr_num_ship = df.groupby('Shipping carriers')['Number of products sold'].sum().reset_index()
+            pr_num_ship = aggregate(compute_df, 'Shipping carriers', 'Number of products sold', 'sum')
             color_sequence = px.colors.qualitative.Vivid
             colors = list(itertools.islice(itertools.cycle(color_sequence), len(pr_num_ship)))
             fig = go.Figure()   
@@ -710,14 +1713,14 @@ elif visualization == "Shipping Analytics":
             fig.update_layout(title='Number of Products Sold by Shipping Carrier', 
                             xaxis_title='Shipping Carrier', 
                             yaxis_title='Number of Products Sold')
-            st.plotly_chart(fig)
+            show_chart(fig)
 
             st.write('\n\n')  # Adds two empty lines
             st.write('\n\n')  # Adds two empty lines
 
 
             #Number of products sold by Transportation modes
-            pr_num_tr = df.groupby('Transportation modes')['Number of products sold'].sum().reset_index()
+            pr_num_tr = aggregate(compute_df, 'Transportation modes', 'Number of products sold', 'sum')
             colors = list(itertools.islice(itertools.cycle(color_sequence), len(pr_num_tr)))
             fig = go.Figure()   
             fig.add_trace(go.Bar(x=pr_num_tr['Transportation modes'], 
@@ -726,14 +1729,14 @@ elif visualization == "Shipping Analytics":
             fig.update_layout(title='Number of Products Sold by Transportation Modes', 
                             xaxis_title='Transportation Modes', 
                             yaxis_title='Number of Products Sold')
-            st.plotly_chart(fig)
+            show_chart(fig)
 
             st.write('\n\n')  # Adds two empty lines
             st.write('\n\n')  # Adds two empty lines
 
 
             #Number of products sold by Routes
-            pr_num_rt = df.groupby('Routes')['Number of products sold'].sum().reset_index()
+            pr_num_rt = aggregate(compute_df, 'Routes', 'Number of products sold', 'sum')
             fig = go.Figure()   
             fig.add_trace(go.Bar(x=pr_num_rt['Routes'], 
                                 y=pr_num_rt['Number of products sold'],
@@ -741,14 +1744,14 @@ elif visualization == "Shipping Analytics":
             fig.update_layout(title='Number of Products Sold by Routes', 
                             xaxis_title='Routes', 
                             yaxis_title='Number of Products Sold')
-            st.plotly_chart(fig)
+            show_chart(fig)
 
             st.write('\n\n')  # Adds two empty lines
             st.write('\n\n')  # Adds two empty lines
 
     with col[1]:
             #Revenue generated by Shipping Carrier
-            rv_sh = df.groupby('Shipping carriers')['Revenue generated'].sum().reset_index()
+            rv_sh = aggregate(compute_df, 'Shipping carriers', 'Revenue generated', 'sum')
             fig = go.Figure()   
             fig.add_trace(go.Bar(x=rv_sh['Shipping carriers'], 
                                 y=rv_sh['Revenue generated'],
@@ -756,13 +1759,13 @@ elif visualization == "Shipping Analytics":
             fig.update_layout(title='Revenue Generated by Shipping Carrier', 
                             xaxis_title='Shipping Carrier', 
                             yaxis_title='Revenue Generated')
-            st.plotly_chart(fig)
+            show_chart(fig)
 
             st.write('\n\n')  # Adds two empty lines
             st.write('\n\n')  # Adds two empty lines
 
             #Revenue generated by Transportation modes
-            rv_tr = df.groupby('Transportation modes')['Revenue generated'].sum().reset_index()
+            rv_tr = aggregate(compute_df, 'Transportation modes', 'Revenue generated', 'sum')
             fig = go.Figure()   
             fig.add_trace(go.Bar(x=rv_tr['Transportation modes'], 
                                 y=rv_tr['Revenue generated'],
@@ -770,14 +1773,14 @@ elif visualization == "Shipping Analytics":
             fig.update_layout(title='Revenue Generated by Transportation Modes', 
                             xaxis_title='Transportation Modes', 
                             yaxis_title='Revenue Generated')
-            st.plotly_chart(fig)
+            show_chart(fig)
 
             st.write('\n\n')  # Adds two empty lines
             st.write('\n\n')  # Adds two empty lines
 
 
             #Revenue generated by Routes
-            rv_rt = df.groupby('Routes')['Revenue generated'].sum().reset_index()
+            rv_rt = aggregate(compute_df, 'Routes', 'Revenue generated', 'sum')
             fig = go.Figure()   
             fig.add_trace(go.Bar(x=rv_rt['Routes'], 
                                 y=rv_rt['Revenue generated'],
@@ -785,14 +1788,14 @@ elif visualization == "Shipping Analytics":
             fig.update_layout(title='Revenue Generated by Routes', 
                             xaxis_title='Routes', 
                             yaxis_title='Revenue Generated')
-            st.plotly_chart(fig)
+            show_chart(fig)
 
             st.write('\n\n')  # Adds two empty lines
             st.write('\n\n')  # Adds two empty lines
 
     with col[2]:
             #Shipping Times by Shipping Carrier
-            st_sp = df.groupby('Shipping carriers')['Shipping times'].mean().reset_index()
+            st_sp = aggregate(compute_df, 'Shipping carriers', 'Shipping times', 'mean')
             fig = go.Figure()   
             fig.add_trace(go.Bar(x=st_sp['Shipping carriers'], 
                                 y=st_sp['Shipping times'],
@@ -800,14 +1803,14 @@ elif visualization == "Shipping Analytics":
             fig.update_layout(title='Average Shipping Time by Shipping Carrier', 
                             xaxis_title='Shipping Carrier', 
                             yaxis_title='AverageShipping Time')
-            st.plotly_chart(fig)
+            show_chart(fig)
     
             st.write('\n\n')  # Adds two empty lines
             st.write('\n\n')  # Adds two empty lines
 
 
             #Shipping Costs by Transportation modes
-            st_tr = df.groupby('Transportation modes')['Shipping times'].mean().reset_index()
+            st_tr = aggregate(compute_df, 'Transportation modes', 'Shipping times', 'mean')
             fig = go.Figure()   
             fig.add_trace(go.Bar(x=st_tr['Transportation modes'], 
                                 y=st_tr['Shipping times'],
@@ -815,13 +1818,13 @@ elif visualization == "Shipping Analytics":
             fig.update_layout(title='Average Shipping Time by Transportation Modes', 
                             xaxis_title='Transportation Modes', 
                             yaxis_title='Average Shipping Time')
-            st.plotly_chart(fig)
+            show_chart(fig)
     
             st.write('\n\n')  # Adds two empty lines
             st.write('\n\n')  # Adds two empty lines
 
             #Shipping Times by Routes
-            st_rt = df.groupby('Routes')['Shipping times'].mean().reset_index()
+            st_rt = aggregate(compute_df, 'Routes', 'Shipping times', 'mean')
             fig = go.Figure()   
             fig.add_trace(go.Bar(x=st_rt['Routes'], 
                                 y=st_rt['Shipping times'],
@@ -829,7 +1832,7 @@ elif visualization == "Shipping Analytics":
             fig.update_layout(title='Average Shipping Time by Routes', 
                             xaxis_title='Routes', 
                             yaxis_title='Average Shipping Time')
-            st.plotly_chart(fig)
+            show_chart(fig)
     
             st.write('\n\n')  # Adds two empty lines
             st.write('\n\n')  # Adds two empty lines
@@ -837,7 +1840,7 @@ elif visualization == "Shipping Analytics":
 
     with col[3]:
             #Shipping Costs by Shipping Carrier
-            sc_sc = df.groupby('Shipping carriers')['Shipping costs'].mean().reset_index()
+            sc_sc = aggregate(compute_df, 'Shipping carriers', 'Shipping costs', 'mean')
             fig = go.Figure()   
             fig.add_trace(go.Bar(x=sc_sc['Shipping carriers'], 
                                 y=sc_sc['Shipping costs'],
@@ -845,14 +1848,14 @@ elif visualization == "Shipping Analytics":
             fig.update_layout(title='Shipping Costs by Shipping Carrier', 
                             xaxis_title='Shipping Carrier', 
                             yaxis_title='Shipping Costs')
-            st.plotly_chart(fig)
+            show_chart(fig)
     
             st.write('\n\n')  # Adds two empty lines
             st.write('\n\n')  # Adds two empty lines
 
 
             #Shipping Costs by Transportation Modes
-            sc_tr = df.groupby('Transportation modes')['Shipping costs'].mean().reset_index()
+            sc_tr = aggregate(compute_df, 'Transportation modes', 'Shipping costs', 'mean')
             fig = go.Figure()   
             fig.add_trace(go.Bar(x=sc_tr['Transportation modes'], 
                                 y=sc_tr['Shipping costs'],
@@ -860,13 +1863,13 @@ elif visualization == "Shipping Analytics":
             fig.update_layout(title='Shipping Costs by Transportation Modes', 
                             xaxis_title='Transportation Modes', 
                             yaxis_title='Shipping Costs')
-            st.plotly_chart(fig)
+            show_chart(fig)
     
             st.write('\n\n')  # Adds two empty lines
             st.write('\n\n')  # Adds two empty lines
 
             #Shipping Costs by Routes
-            sc_rt = df.groupby('Routes')['Shipping costs'].mean().reset_index()
+            sc_rt = aggregate(compute_df, 'Routes', 'Shipping costs', 'mean')
             fig = go.Figure()   
             fig.add_trace(go.Bar(x=sc_rt['Routes'], 
                                 y=sc_rt['Shipping costs'],
@@ -874,13 +1877,13 @@ elif visualization == "Shipping Analytics":
             fig.update_layout(title='Shipping Costs by Routes', 
                             xaxis_title='Routes', 
                             yaxis_title='Shipping Costs')
-            st.plotly_chart(fig)
+            show_chart(fig)
 
             st.write('\n\n')  # Adds two empty lines
             st.write('\n\n')  # Adds two empty lines
 
     #Defect Rate by Shipping Carrier
-    defect_by_carrier = df.groupby('Shipping carriers')['Defect rates'].mean().reset_index()
+    defect_by_carrier = aggregate(compute_df, 'Shipping carriers', 'Defect rates', 'mean')
 
     # Sort carriers by defect rate for better visualization
     defect_by_carrier = defect_by_carrier.sort_values('Defect rates', ascending=False)
@@ -902,14 +1905,14 @@ elif visualization == "Shipping Analytics":
     fig.update_xaxes(tickformat='..2f}%')
 
     # Display the chart in Streamlit
-    st.plotly_chart(fig)
+    show_chart(fig)
 
     st.write('\n\n')  # Adds two empty lines
     st.write('\n\n')  # Adds two empty lines
 
 
     #Defect Rate by Transportation Modes
-    defect_by_transport = df.groupby('Transportation modes')['Defect rates'].mean().reset_index()
+    defect_by_transport = aggregate(compute_df, 'Transportation modes', 'Defect rates', 'mean')
 
     # Sort suppliers by defect rate for better visualization
     defect_by_transport = defect_by_transport.sort_values('Defect rates', ascending=False)
@@ -931,47 +1934,313 @@ elif visualization == "Shipping Analytics":
     fig.update_xaxes(tickformat='..2f}%')
 
     # Display the chart in Streamlit
-    st.plotly_chart(fig)
+    show_chart(fig)
 
     st.write('\n\n')  # Adds two empty lines
     st.write('\n\n')  # Adds two empty lines
 
     #Product Type by Shipping Carrier
-    pr_cos = pd.crosstab(df['Shipping carriers'], df['Product type'])
-    pr_cos = pr_cos.reset_index()
+    pr_cos = category_crosstab(dataset, 'Shipping carriers', 'Product type')
+    fig = make_breakdown(pr_cos, 'Product Type by Shipping Carrier')
 
-    melted_df = pd.melt(pr_cos, id_vars=['Shipping carriers'], 
-                        var_name='Product type', 
-                        value_name='Count')
-    fig = px.pie(melted_df, values='Count', names='Product type', 
-             facet_col='Shipping carriers', 
-             title='Product Type by Shipping Carrier',
-             hole=0.6,
-             color_discrete_sequence=px.colors.qualitative.Pastel)
+    show_chart(fig)
 
-    fig.update_traces(textposition='inside', textinfo='percent+label')
+    st.write('\n\n')  # Adds two empty lines
+    st.write('\n\n')  # Adds two empty lines
+
+    #Product Type by Transportation Modes
+    pr_cos = category_crosstab(dataset, 'Transportation modes', 'Product type')
+    fig = make_breakdown(pr_cos, 'Product Type by Transportation Modes')
 
-    st.plotly_chart(fig)
+    show_chart(fig)
 
     st.write('\n\n')  # Adds two empty lines
     st.write('\n\n')  # Adds two empty lines
 
-    #Product Type by Transportation Modes
-    pr_cos = pd.crosstab(df['Transportation modes'], df['Product type'])
-    pr_cos = pr_cos.reset_index()
+    #What-if Shipping Scenario
+    st.markdown('##### What-if: Reassign Shipments')
+    tables = derived(dataset, shipping_tables)
 
-    melted_df = pd.melt(pr_cos, id_vars=['Transportation modes'], 
-                        var_name='Product type', 
-                        value_name='Count')
-    fig = px.pie(melted_df, values='Count', names='Product type', 
-             facet_col='Transportation modes', 
-             title='Product Type by Transportation Modes',
-             hole=0.6,
-             color_discrete_sequence=px.colors.qualitative.Pastel)
+    col = st.columns((1, 1, 1, 1, 1, 1), gap='medium')
+    match, assign = {}, {}
+    for i, (key, level) in enumerate(zip(SHIPPING_KEYS, tables['levels'])):
+        with col[i]:
+            choice = st.selectbox(f'From {key.lower()}', ['Any'] + list(level), key=f'match_{key}')
+            if choice != 'Any':
+                match[key] = choice
+        with col[i + 3]:
+            choice = st.selectbox(f'To {key.lower()}', ['Keep'] + list(level), key=f'assign_{key}')
+            if choice != 'Keep':
+                assign[key] = choice
 
-    fig.update_traces(textposition='inside', textinfo='percent+label')
+    baseline, scenario = evaluate_scenarios(tables, [[], [{'match': match, 'assign': assign}]]).to_dict('records')
 
-    st.plotly_chart(fig)
+    col = st.columns((1, 1, 1, 1), gap='medium')
+    with col[0]:
+        st.metric(label='Total Shipping Cost', value=f"$ {scenario['Total shipping cost']:,.0f}",
+                  delta=f"{scenario['Total shipping cost'] - baseline['Total shipping cost']:,.0f}", delta_color='inverse')
+    with col[1]:
+        st.metric(label='Average Shipping Time (Days)', value=f"{scenario['Average shipping time']:,.2f}",
+                  delta=f"{scenario['Average shipping time'] - baseline['Average shipping time']:,.2f}", delta_color='inverse')
+    with col[2]:
+        st.metric(label='Average Defect Rate', value=f"{scenario['Average defect rate']:,.2f}%",
+                  delta=f"{scenario['Average defect rate'] - baseline['Average defect rate']:,.2f}", delta_color='inverse')
+    with col[3]:
+        st.metric(label='SKUs Moved', value=f"{scenario['SKUs moved']:,.0f}")
 
     st.write('\n\n')  # Adds two empty lines
-    st.write('\n\n')  # Adds two empty lines
\ No newline at end of file
+
+    #Cheapest Single Reassignments
+    scenarios, labels = single_move_scenarios(tables)
+    results = evaluate_scenarios(tables, scenarios)
+    results.insert(0, 'Scenario', labels)
+    for column in ['Total shipping cost', 'Average shipping time', 'Average defect rate']:
+        results[column] = results[column] - baseline[column]
+    results = results[results['SKUs moved'] > 0].sort_values('Total shipping cost')
+
+    st.markdown('###### Cheapest Single Reassignments (change vs. today)')
+    st.dataframe(results.head(10), hide_index=True, use_container_width=True)
+
+    st.write('\n\n')  # Adds two empty lines
+    st.write('\n\n')  # Adds two empty lines
+
+
+
+
+
+#######################
+
+
+
+# Inventory Planning
+elif visualization == "Inventory Planning":
+    st.title("Inventory Planning")
+    st.write('\n\n')  # Adds two empty lines
+    st.write('\n\n')  # Adds two empty lines
+
+    # Sidebar Parameters
+    st.sidebar.header('⚙️ Parameters')
+    service_level = st.sidebar.slider('Service Level', min_value=0.80, max_value=0.999, value=0.95, step=0.005, format='%.3f')
+    period_days = st.sidebar.number_input('Sales Period (Days)', min_value=1, value=90,
+                                          help='Number of days covered by "Number of products sold".')
+
+    plan = inventory_plan(dataset, data_version, service_level, period_days)
+
+    col = st.columns((1, 1, 1, 1), gap='medium')
+    with col[0]:
+        st.metric(label='SKUs at or Below Reorder Point', value=f"{plan['Reorder now'].sum():,.0f}")
+    with col[1]:
+        st.metric(label='Median Days of Cover', value=f"{plan['Days of cover'].median():,.1f}")
+    with col[2]:
+        st.metric(label='Total Safety Stock (Units)', value=f"{plan['Safety stock'].sum():,.0f}")
+    with col[3]:
+        st.metric(label='Units to Order', value=f"{plan.loc[plan['Reorder now'], 'Order quantities'].sum():,.0f}")
+
+    st.write('\n\n')  # Adds two empty lines
+
+    col = st.columns((1, 1), gap='medium')
+    with col[0]:
+        # Days of Cover Histogram, binned here so only the bins are sent to the browser
+        cover = plan['Days of cover'].replace(np.inf, np.nan).dropna()
+        counts, edges = np.histogram(cover.clip(upper=cover.quantile(0.99)), bins=30)
+        fig = go.Figure(go.Bar(x=(edges[:-1] + edges[1:]) / 2, y=counts,
+                               width=np.diff(edges), marker_color=px.colors.qualitative.Vivid[0]))
+        fig.update_layout(title='Days of Cover Distribution',
+                          xaxis_title='Days of Cover',
+                          yaxis_title='Number of SKUs')
+        show_chart(fig, use_container_width=True)
+
+    with col[1]:
+        # Reorder Point vs Stock by Product Type
+        type_plan = plan.groupby('Product type')[['Stock levels', 'Reorder point', 'Safety stock']].sum().reset_index()
+        fig = px.bar(type_plan,
+                     x='Product type',
+                     y=['Stock levels', 'Reorder point', 'Safety stock'],
+                     barmode='group',
+                     labels={'value': 'Units', 'variable': ''},
+                     title='Stock vs. Reorder Point by Product Type',
+                     color_discrete_sequence=px.colors.qualitative.Vivid)
+        show_chart(fig, use_container_width=True)
+
+    # Most Urgent SKUs
+    st.markdown('###### Most Urgent SKUs')
+    st.dataframe(
+        plan.nsmallest(INVENTORY_TABLE_ROWS, 'Days of cover'),
+        hide_index=True,
+        height=300,
+        column_config={
+            'Daily demand': st.column_config.NumberColumn(format='%.2f'),
+            'Days of cover': st.column_config.NumberColumn(format='%.1f'),
+        }
+    )
+
+    st.write('\n\n')  # Adds two empty lines
+    st.write('\n\n')  # Adds two empty lines
+
+    # Stock-out Risk Simulation
+    st.markdown('##### Stock-out Risk Simulation')
+    col = st.columns((1, 1, 1, 1), gap='medium')
+    with col[0]:
+        trials = st.number_input('Trials', min_value=100, max_value=100_000, value=1000, step=100)
+    with col[1]:
+        seed = st.number_input('Random Seed', min_value=0, value=42)
+    with col[2]:
+        make_probability = st.slider('Made-to-Order Share', min_value=0.0, max_value=1.0, value=0.2,
+                                     help='Share of orders that also wait for the manufacturing lead time.')
+    with col[3]:
+        lead_cv = st.slider('Lead Time Variability (CV)', min_value=0.05, max_value=1.0, value=0.25)
+
+    # Results are kept per data version and parameter set until the next run
+    simulation_key = (data_version, service_level, period_days, trials, seed, make_probability, lead_cv)
+    if st.button('Run Simulation'):
+        inputs = derived(dataset, inventory_inputs)
+        progress_bar = st.progress(0.0, text='Simulating stock-outs...')
+        risk = simulate_stockouts(
+            stock=inputs['stock'],
+            demand=inputs['sold'] / period_days,
+            demand_cv=inputs['sold_cv'],
+            lead=inputs['lead'],
+            ship=df['Shipping times'].to_numpy(dtype=float),
+            make=df['Manufacturing lead time'].to_numpy(dtype=float),
+            make_probability=make_probability,
+            lead_cv=lead_cv,
+            trials=trials,
+            seed=seed,
+            progress=lambda fraction: progress_bar.progress(fraction, text='Simulating stock-outs...'))
+        progress_bar.empty()
+        st.session_state['stockout_risk'] = (simulation_key, risk)
+
+    if st.session_state.get('stockout_risk', (None,))[0] == simulation_key:
+        risk = pd.DataFrame({
+            'SKU': df['SKU'],
+            'Supplier name': df['Supplier name'],
+            'Stock-out probability': st.session_state['stockout_risk'][1],
+        })
+
+        col = st.columns((1, 2), gap='medium')
+        with col[0]:
+            st.metric(label='Mean Stock-out Probability', value=f"{100 * risk['Stock-out probability'].mean():.1f}%")
+            st.metric(label='SKUs Above 50% Risk', value=f"{(risk['Stock-out probability'] > 0.5).sum():,.0f}")
+
+        with col[1]:
+            # Stock-out Risk by Supplier
+            supplier_risk = risk.groupby('Supplier name')['Stock-out probability'].mean().reset_index()
+            fig = px.bar(supplier_risk,
+                         x='Supplier name',
+                         y='Stock-out probability',
+                         color='Supplier name',
+                         color_discrete_sequence=px.colors.qualitative.Vivid,
+                         labels={'Stock-out probability': 'Mean Stock-out Probability', 'Supplier name': 'Supplier'},
+                         title='Stock-out Risk by Supplier')
+            fig.update_layout(showlegend=False)
+            fig.update_yaxes(tickformat='.0%')
+            show_chart(fig, use_container_width=True)
+
+        st.dataframe(
+            risk.nlargest(INVENTORY_TABLE_ROWS, 'Stock-out probability'),
+            hide_index=True,
+            height=300,
+            column_config={
+                'Stock-out probability': st.column_config.ProgressColumn(
+                    'Stock-out probability', format='%.2f', min_value=0, max_value=1),
+            }
+        )
+    else:
+        st.caption('Run the simulation to estimate stock-out probabilities for the current parameters.')
+
+
+
+
+#######################
+
+
+
+# Cost & Margin
+elif visualization == "Cost & Margin":
+    st.title("Cost & Margin")
+    st.write('\n\n')  # Adds two empty lines
+    st.write('\n\n')  # Adds two empty lines
+
+    rollups = derived(dataset, cost_rollups)
+
+    # Sidebar Drill-down, each level offering the children of the level above
+    st.sidebar.header('🔎 Drill-down')
+    path = ()
+    for key in COST_HIERARCHY[:-1]:
+        children = cost_node(rollups, path)[1].index
+        choice = st.sidebar.selectbox(key, ['All'] + list(children), key=f'drill_{key}')
+        if choice == 'All':
+            break
+        path += (choice,)
+
+    node, children = cost_node(rollups, path)
+    child_level = COST_HIERARCHY[len(path)]
+    st.markdown(f"###### {' › '.join(('All Products',) + path)}")
+
+    col = st.columns((1, 1, 1, 1), gap='medium')
+    with col[0]:
+        st.metric(label='Revenue', value=f"$ {node['Revenue generated']:,.0f}")
+    with col[1]:
+        st.metric(label='Cost to Serve', value=f"$ {node['Cost to serve']:,.0f}")
+    with col[2]:
+        st.metric(label='Margin', value=f"$ {node['Margin']:,.0f}")
+    with col[3]:
+        st.metric(label='Margin %', value=f"{node['Margin %']:,.1f}%")
+
+    st.write('\n\n')  # Adds two empty lines
+
+    col = st.columns((1, 1), gap='medium')
+    children = children.reset_index().rename(columns={'index': child_level})
+    with col[0]:
+        # Cost Breakdown by Child
+        fig = px.bar(children,
+                     x=child_level,
+                     y=['Manufacturing costs', 'Shipping costs', 'Costs'],
+                     labels={'value': 'Cost', 'variable': 'Cost Component'},
+                     title=f'Cost to Serve by {child_level}',
+                     color_discrete_sequence=px.colors.qualitative.Vivid)
+        show_chart(fig, use_container_width=True)
+
+    with col[1]:
+        # Margin by Child
+        fig = px.bar(children.sort_values('Margin %'),
+                     x='Margin %',
+                     y=child_level,
+                     orientation='h',
+                     color='Margin %',
+                     color_continuous_scale='RdYlGn',
+                     title=f'Margin % by {child_level}',
+                     text='Margin %')
+        fig.update_traces(texttemplate='%{text:.1f}%', textposition='outside')
+        fig.update_layout(coloraxis_showscale=False)
+        show_chart(fig, use_container_width=True)
+
+    # Detailed Cost Table
+    st.markdown(f'###### {child_level} Cost Table')
+    st.dataframe(
+        children[[child_level, 'SKUs', 'Revenue generated', 'Cost to serve', 'Margin', 'Margin %']],
+        hide_index=True,
+        height=300,
+        column_config={
+            'Revenue generated': st.column_config.NumberColumn(format='$ %.0f'),
+            'Cost to serve': st.column_config.NumberColumn(format='$ %.0f'),
+            'Margin': st.column_config.NumberColumn(format='$ %.0f'),
+            'Margin %': st.column_config.NumberColumn(format='%.1f%%'),
+        }
+    )
+
+
+
+
+#######################
+# Payload report
+if payload_budget_mode:
+    with st.sidebar:
+        st.write('\n\n')  # Adds two empty lines
+        st.markdown('##### Page Payload')
+        page_bytes = sum(entry['Bytes'] for entry in payload_log)
+        original_page_bytes = sum(entry['Original'] for entry in payload_log)
+        st.caption(f"{page_bytes / 1024:,.0f} KB of {PAGE_PAYLOAD_BUDGET / 1024:,.0f} KB budget "
+                   f"({original_page_bytes / 1024:,.0f} KB untrimmed)")
+        if payload_log:
+            st.dataframe(pd.DataFrame(payload_log), hide_index=True)
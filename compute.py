@@ -0,0 +1,37 @@
+#######################
+# Import libraries
+import pandas as pd
+
+try:
+    import polars as pl
+except ImportError:
+    pl = None
+
+
+#######################
+# Page aggregations
+# The pages group on pandas frames, or on Polars' lazy, multi-threaded engine
+# when they are handed the dataset as a LazyFrame (needs `pip install
+# polars`). Either way the result is the same small pandas frame, one row per
+# non-null key in key order, ready for plotting.
+HAVE_POLARS = pl is not None
+
+# The dataset as a Polars LazyFrame; categoricals become Enums so that they
+# keep pandas' category order when sorted
+def polars_frame(df):
+    enums = {column: pl.Enum(df[column].cat.categories.tolist())
+             for column in df.columns if isinstance(df[column].dtype, pd.CategoricalDtype)}
+    return pl.from_pandas(df).with_columns(**{column: pl.col(column).cast(enum) for column, enum in enums.items()}).lazy()
+
+
+# Group by one column and aggregate another, e.g. ('Routes', 'Shipping costs', 'mean')
+def aggregate(frame, by, column, how):
+    if HAVE_POLARS and isinstance(frame, pl.LazyFrame):
+        return (frame
+                .filter(pl.col(by).is_not_null())
+                .group_by(by)
+                .agg(getattr(pl.col(column), how)())
+                .sort(by)
+                .collect()
+                .to_pandas())
+    return getattr(frame.groupby(by, observed=True)[column], how)().reset_index()
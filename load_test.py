@@ -0,0 +1,336 @@
+#######################
+# Concurrent-load test for the dashboard
+#
+# Starts its own instance of app.py and replays browser-like sessions against
+# it over Streamlit's websocket protocol: every simulated user switches
+# between the visualizations and changes the ABC filters, and each rerun is
+# timed from the moment the widget change is sent until the script has
+# finished. Runs step through dataset sizes and concurrency levels and report
+# rerun latency percentiles with the server's CPU and memory use.
+#
+#   python load_test.py --concurrency 1,4,16 --scales 1,10,100
+#
+# Dataset sizes other than 1 rewrite the app's data file with the rows
+# repeated, and the app hot-reloads it: a scaled run changes the data that
+# every session connected to that instance sees, and the app keeps a KPI
+# snapshot and disk-cache entries of every version it loads. So the instance
+# under test is never a shared one: it runs on a scratch copy of the data
+# (SUPPLY_DASHBOARD_DATA_PATH), with its snapshots and disk cache next to
+# that copy, all deleted afterwards.
+
+#######################
+# Import libraries
+import argparse
+import asyncio
+import csv
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+import numpy as np
+import pandas as pd
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from tornado.websocket import websocket_connect
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+#######################
+# Settings
+PAGE_WIDGET = 'Choose a Visualization'
+ABC_WIDGET = 'ABC Category'
+ABC_PAGE = 'ABC Analysis'
+ABC_CATEGORIES = ['A', 'B', 'C']
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVER_START_SECONDS = 60
+RESULT_COLUMNS = ['Scale', 'Rows', 'Concurrency', 'Reruns', 'Errors',
+                  'p50 (ms)', 'p95 (ms)', 'p99 (ms)', 'CPU (%)', 'RSS (MB)']
+
+
+#######################
+# Simulated session
+class Session:
+    def __init__(self, url):
+        self.url = url
+        self.widgets = {}  # label -> (widget id, options)
+        self.page = 0
+        self.abc = list(range(len(ABC_CATEGORIES)))
+
+    async def connect(self):
+        self.connection = await websocket_connect(self.url, max_message_size=1 << 30)
+
+    def close(self):
+        self.connection.close()
+
+    # Send the current widget states and wait for the script run to finish
+    async def rerun(self):
+        message = BackMsg()
+        client_state = message.rerun_script
+        client_state.query_string = ''
+        client_state.page_script_hash = ''
+        if PAGE_WIDGET in self.widgets:
+            state = client_state.widget_states.widgets.add()
+            state.id = self.widgets[PAGE_WIDGET][0]
+            state.int_value = self.page
+        if ABC_WIDGET in self.widgets and self.page_name() == ABC_PAGE:
+            state = client_state.widget_states.widgets.add()
+            state.id = self.widgets[ABC_WIDGET][0]
+            state.int_array_value.data.extend(self.abc)
+
+        started = time.perf_counter()
+        await self.connection.write_message(message.SerializeToString(), binary=True)
+        while True:
+            payload = await self.connection.read_message()
+            if payload is None:
+                raise ConnectionError('server closed the websocket')
+            forward = ForwardMsg()
+            forward.ParseFromString(payload)
+            kind = forward.WhichOneof('type')
+            if kind == 'delta':
+                self.record_widget(forward.delta)
+            elif kind == 'session_event' and forward.session_event.WhichOneof('type') == 'script_compilation_exception':
+                raise RuntimeError('app.py failed to compile')
+            elif kind == 'script_finished':
+                if forward.script_finished == ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                    continue
+                return time.perf_counter() - started
+
+    def record_widget(self, delta):
+        if delta.WhichOneof('type') != 'new_element':
+            return
+        element = delta.new_element
+        if element.WhichOneof('type') == 'exception' and not element.exception.is_warning:
+            raise RuntimeError(f'{self.page_name()}: {element.exception.message}')
+        if element.WhichOneof('type') in ('selectbox', 'multiselect'):
+            widget = getattr(element, element.WhichOneof('type'))
+            self.widgets[widget.label] = (widget.id, list(widget.options))
+
+    def page_name(self):
+        options = self.widgets.get(PAGE_WIDGET, (None, []))[1]
+        return options[self.page] if self.page < len(options) else None
+
+    # A page switch, or an ABC filter change while on the ABC page
+    def next_action(self, rng):
+        if self.page_name() == ABC_PAGE and ABC_WIDGET in self.widgets and rng.random() < 0.5:
+            self.abc = sorted(rng.sample(range(len(ABC_CATEGORIES)), rng.randint(1, len(ABC_CATEGORIES))))
+        else:
+            self.page = rng.randrange(len(self.widgets[PAGE_WIDGET][1]))
+            self.abc = list(range(len(ABC_CATEGORIES)))
+
+
+async def run_session(url, actions, think_time, seed, latencies, errors):
+    rng = random.Random(seed)
+    session = Session(url)
+    try:
+        await session.connect()
+        await session.rerun()  # first page load
+        for _ in range(actions):
+            await asyncio.sleep(rng.expovariate(1 / think_time) if think_time > 0 else 0)
+            session.next_action(rng)
+            latencies.append(await session.rerun())
+    except Exception as error:
+        errors.append(error)
+    finally:
+        if hasattr(session, 'connection'):
+            session.close()
+
+
+#######################
+# Server resource usage
+class ResourceMonitor:
+    def __init__(self, pid):
+        self.pid = pid
+        self.process = psutil.Process(pid) if psutil and pid else None
+
+    # Total CPU seconds and resident memory in bytes, children included
+    def sample(self):
+        if self.process is not None:
+            processes = [self.process] + self.process.children(recursive=True)
+            cpu = rss = 0
+            for process in processes:
+                try:
+                    times = process.cpu_times()
+                    cpu += times.user + times.system
+                    rss += process.memory_info().rss
+                except psutil.NoSuchProcess:
+                    pass
+            return cpu, rss
+        if self.pid and os.path.exists(f'/proc/{self.pid}/stat'):
+            stats = proc_stats()
+            cpu = rss = 0
+            for pid in descendants(self.pid, stats):
+                fields = stats[pid]
+                cpu += (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+                rss += int(fields[21]) * os.sysconf('SC_PAGE_SIZE')
+            return cpu, rss
+        return None, None
+
+
+# The fields after the command name of every process's /proc/<pid>/stat
+def proc_stats():
+    stats = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as file:
+                stats[int(entry)] = file.read().rsplit(')', 1)[1].split()
+        except OSError:
+            pass  # exited since the listing
+    return stats
+
+
+# A process and all of its children, e.g. the stock-out simulation's workers
+def descendants(pid, stats):
+    children = {}
+    for child, fields in stats.items():
+        children.setdefault(int(fields[1]), []).append(child)
+    found, pending = [], [pid]
+    while pending:
+        pid = pending.pop()
+        if pid in stats:
+            found.append(pid)
+            pending.extend(children.get(pid, []))
+    return found
+
+
+async def run_level(url, concurrency, actions, think_time, monitor, seed):
+    latencies, errors = [], []
+    peak_rss = 0
+
+    async def watch_memory():
+        nonlocal peak_rss
+        while True:
+            peak_rss = max(peak_rss, monitor.sample()[1] or 0)
+            await asyncio.sleep(0.25)
+
+    cpu_before, _ = monitor.sample()
+    started = time.perf_counter()
+    watcher = asyncio.ensure_future(watch_memory())
+    await asyncio.gather(*[run_session(url, actions, think_time, seed + i, latencies, errors)
+                           for i in range(concurrency)])
+    watcher.cancel()
+    elapsed = time.perf_counter() - started
+    cpu_after, _ = monitor.sample()
+
+    milliseconds = 1000 * np.array(latencies) if latencies else np.array([np.nan])
+    return {
+        'Concurrency': concurrency,
+        'Reruns': len(latencies),
+        'Errors': len(errors),
+        'p50 (ms)': np.percentile(milliseconds, 50),
+        'p95 (ms)': np.percentile(milliseconds, 95),
+        'p99 (ms)': np.percentile(milliseconds, 99),
+        'CPU (%)': 100 * (cpu_after - cpu_before) / elapsed if cpu_before is not None else np.nan,
+        'RSS (MB)': peak_rss / 2 ** 20 if peak_rss else np.nan,
+    }
+
+
+#######################
+# Dataset sizes
+# Replace the data file with its rows repeated `scale` times under new SKUs
+def write_scaled_data(path, original, scale):
+    scaled = pd.concat([original] * scale, ignore_index=True)
+    scaled['SKU'] = [f'SKU{i}' for i in range(len(scaled))]
+    scaled.to_csv(f'{path}.tmp', index=False)
+    os.replace(f'{path}.tmp', path)
+    return len(scaled)
+
+
+def parse_levels(text):
+    return [int(level) for level in text.split(',') if level.strip()]
+
+
+def print_results(results):
+    table = pd.DataFrame(results, columns=RESULT_COLUMNS)
+    print(table.to_string(index=False, float_format=lambda value: f'{value:,.1f}'))
+
+
+#######################
+# Instance under test
+# Start app.py on its own port, reading the given data file
+def start_server(data_path, port):
+    env = dict(os.environ, SUPPLY_DASHBOARD_DATA_PATH=data_path)
+    server = subprocess.Popen([sys.executable, '-m', 'streamlit', 'run', 'app.py', '--server.headless', 'true',
+                               '--server.port', str(port)], cwd=APP_DIR, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + SERVER_START_SECONDS
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f'streamlit exited with status {server.returncode}')
+        try:
+            urllib.request.urlopen(f'http://localhost:{port}/_stcore/health', timeout=1)
+            return server
+        except OSError:
+            time.sleep(0.5)
+    server.terminate()
+    raise RuntimeError(f'streamlit did not answer on port {port} within {SERVER_START_SECONDS} s')
+
+
+def stop_server(server):
+    server.terminate()
+    try:
+        server.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        server.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay concurrent dashboard sessions against a scratch app.py.')
+    parser.add_argument('--port', type=int, default=8599, help='port for the instance under test')
+    parser.add_argument('--concurrency', default='1,2,4,8,16', help='comma-separated numbers of simultaneous sessions')
+    parser.add_argument('--scales', default='1', help='comma-separated dataset size multipliers')
+    parser.add_argument('--actions', type=int, default=20, help='page switches and filter changes per session')
+    parser.add_argument('--think-time', type=float, default=0.5, help='mean pause between actions, in seconds')
+    parser.add_argument('--data', default='data/supply_chain_data.csv', help='data file to copy and scale')
+    parser.add_argument('--reload-wait', type=float, default=10, help='seconds to let the app hot-reload resized data')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--csv', help='also write the results to this CSV file')
+    args = parser.parse_args()
+
+    original = pd.read_csv(args.data)
+    scratch = tempfile.mkdtemp(prefix='load-test-')
+    data_path = os.path.join(scratch, os.path.basename(args.data))
+    shutil.copy2(args.data, data_path)
+    url = f'ws://localhost:{args.port}/_stcore/stream'
+
+    results = []
+    server = None
+    try:
+        server = start_server(data_path, args.port)
+        monitor = ResourceMonitor(server.pid)
+        for scale in parse_levels(args.scales):
+            rows = len(original)
+            if scale != 1 or results:
+                rows = write_scaled_data(data_path, original, scale)
+                time.sleep(args.reload_wait)
+            for concurrency in parse_levels(args.concurrency):
+                result = asyncio.run(run_level(url, concurrency, args.actions, args.think_time,
+                                               monitor, args.seed))
+                results.append({'Scale': scale, 'Rows': rows, **result})
+                print_results(results[-1:])
+    finally:
+        if server is not None:
+            stop_server(server)
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    print()
+    print_results(results)
+    if args.csv:
+        with open(args.csv, 'w', newline='') as file:
+            writer = csv.DictWriter(file, fieldnames=RESULT_COLUMNS)
+            writer.writeheader()
+            writer.writerows(results)
+
+
+if __name__ == '__main__':
+    main()
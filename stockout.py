@@ -0,0 +1,70 @@
+#######################
+# Import libraries
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+
+#######################
+# Stock-out simulation
+# Each trial draws a replenishment lead time per SKU (supplier lead time plus
+# shipping time, plus manufacturing lead time when the order has to be made)
+# and the demand over that lead time, and counts a stock-out when demand
+# exceeds the stock on hand. SKUs are split into fixed-size chunks, each with
+# its own child seed, so results depend on the seed but not on the number of
+# worker processes.
+CHUNK_SKUS = 10_000
+BATCH_TRIALS = 200  # trials drawn at once per chunk, bounds worker memory
+MIN_CV = 0.01
+
+
+# Gamma draws with the given mean and coefficient of variation
+def sample_gamma(rng, mean, cv, size):
+    shape = 1 / np.maximum(cv, MIN_CV) ** 2
+    return rng.gamma(np.broadcast_to(shape, size), np.broadcast_to(mean / shape, size))
+
+
+# Stock-out counts for one chunk of SKUs
+def simulate_chunk(seed, stock, demand, demand_cv, lead, ship, make, make_probability, lead_cv, trials):
+    rng = np.random.default_rng(seed)
+    stockouts = np.zeros(len(stock), dtype=np.int64)
+    for start in range(0, trials, BATCH_TRIALS):
+        size = (min(BATCH_TRIALS, trials - start), len(stock))
+        lead_time = sample_gamma(rng, lead, lead_cv, size) + sample_gamma(rng, ship, lead_cv, size)
+        made_to_order = rng.random(size) < make_probability
+        lead_time += np.where(made_to_order, sample_gamma(rng, make, lead_cv, size), 0)
+
+        # Demand over L days has mean d * L and its spread shrinks with sqrt(L)
+        lead_demand = sample_gamma(rng, demand * lead_time, demand_cv / np.sqrt(np.maximum(lead_time, 1)), size)
+        stockouts += (lead_demand > stock).sum(axis=0)
+    return stockouts
+
+
+# Stock-out probability per SKU, simulated across a process pool
+def simulate_stockouts(stock, demand, demand_cv, lead, ship, make, make_probability=0.2, lead_cv=0.25,
+                       trials=1000, seed=0, workers=None, progress=None):
+    arrays = [np.broadcast_to(np.asarray(values, dtype=float), np.shape(stock))
+              for values in (stock, demand, demand_cv, lead, ship, make)]
+    starts = range(0, len(arrays[0]), CHUNK_SKUS)
+    seeds = np.random.SeedSequence(seed).spawn(len(starts))
+    stockouts = np.zeros(len(arrays[0]), dtype=np.int64)
+
+    # Spawned workers avoid forking the dashboard server's threads; each costs
+    # an interpreter start, so never start more than there are chunks
+    context = multiprocessing.get_context('spawn')
+    workers = min(workers or os.cpu_count(), max(len(starts), 1))
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        futures = {
+            pool.submit(simulate_chunk, chunk_seed, *[values[start:start + CHUNK_SKUS] for values in arrays],
+                        make_probability, lead_cv, trials): start
+            for start, chunk_seed in zip(starts, seeds)
+        }
+        for done, future in enumerate(as_completed(futures), 1):
+            start = futures[future]
+            stockouts[start:start + CHUNK_SKUS] = future.result()
+            if progress is not None:
+                progress(done / len(futures))
+
+    return stockouts / trials
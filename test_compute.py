@@ -0,0 +1,84 @@
+import os
+import re
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from compute import HAVE_POLARS, aggregate, polars_frame
+
+pytestmark = pytest.mark.skipif(not HAVE_POLARS, reason='polars is not installed')
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Every (by, column, how) the pages aggregate
+SPECS = [
+    ('State', 'Revenue generated', 'sum'),
+    ('Product type', 'Number of products sold', 'sum'),
+    ('Product type', 'Price', 'mean'),
+    ('Product type', 'Revenue generated', 'sum'),
+    ('Supplier name', 'Number of products sold', 'sum'),
+    ('Supplier name', 'Revenue generated', 'sum'),
+    ('Supplier name', 'Manufacturing lead time', 'mean'),
+    ('Supplier name', 'Defect rates', 'mean'),
+    ('Shipping carriers', 'Number of products sold', 'sum'),
+    ('Shipping carriers', 'Revenue generated', 'sum'),
+    ('Shipping carriers', 'Shipping times', 'mean'),
+    ('Shipping carriers', 'Shipping costs', 'mean'),
+    ('Shipping carriers', 'Defect rates', 'mean'),
+    ('Transportation modes', 'Number of products sold', 'sum'),
+    ('Transportation modes', 'Revenue generated', 'sum'),
+    ('Transportation modes', 'Shipping times', 'mean'),
+    ('Transportation modes', 'Shipping costs', 'mean'),
+    ('Transportation modes', 'Defect rates', 'mean'),
+    ('Routes', 'Number of products sold', 'sum'),
+    ('Routes', 'Revenue generated', 'sum'),
+    ('Routes', 'Shipping times', 'mean'),
+    ('Routes', 'Shipping costs', 'mean'),
+]
+
+
+# The shipped dataset with a categorical State (unknown cities left null, as
+# the gazetteer join does), some null keys and some missing values
+@pytest.fixture(scope='module')
+def df():
+    df = pd.read_csv(os.path.join(ROOT, 'data', 'supply_chain_data.csv'))
+    gazetteer = pd.read_csv(os.path.join(ROOT, 'data', 'gazetteer.csv'))
+    states = dict(zip(gazetteer['City'].str.casefold(), gazetteer['State']))
+    df['State'] = df['Location'].str.casefold().map(states).astype(pd.CategoricalDtype(gazetteer['State'].unique()))
+    df.loc[df.index % 13 == 0, 'State'] = None
+
+    rng = np.random.default_rng(0)
+    for column in ['Product type', 'Supplier name', 'Shipping carriers', 'Transportation modes', 'Routes']:
+        df.loc[rng.random(len(df)) < 0.05, column] = None
+    for column in ['Revenue generated', 'Price', 'Defect rates']:
+        df.loc[rng.random(len(df)) < 0.05, column] = np.nan
+    return df
+
+
+@pytest.fixture(scope='module')
+def lazy(df):
+    return polars_frame(df)
+
+
+def test_specs_cover_the_pages():
+    with open(os.path.join(ROOT, 'app.py')) as file:
+        source = file.read()
+    used = set(re.findall(r"aggregate\(compute_df, '([^']+)', '([^']+)', '([^']+)'\)", source))
+    used |= {('State', 'Revenue generated', 'sum')}  # make_choropleth names them in variables
+    assert used == set(SPECS)
+
+
+@pytest.mark.parametrize('by, column, how', SPECS)
+def test_polars_matches_pandas(df, lazy, by, column, how):
+    expected = aggregate(df, by, column, how)
+    result = aggregate(lazy, by, column, how)
+
+    assert list(result.columns) == list(expected.columns)
+    assert result[by].astype(str).tolist() == expected[by].astype(str).tolist()
+    assert not result[by].isna().any()
+    if isinstance(expected[by].dtype, pd.CategoricalDtype):
+        assert result[by].cat.categories.tolist() == expected[by].cat.categories.tolist()
+    else:
+        assert result[by].dtype == expected[by].dtype
+    assert result[column].dtype == expected[column].dtype
+    np.testing.assert_allclose(result[column], expected[column], rtol=1e-12)